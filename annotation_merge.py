@@ -0,0 +1,66 @@
+import os
+import csv
+import time
+from os.path import join as joined
+
+CSV_HEADER = ['tick', 'type', 'videoname', 'img_name', 'region_count', 'sample_attr', 'frame_attr', 'comment', 'anchors']
+ROW_FIELDS = CSV_HEADER[3:]
+
+
+def RowValues(row):
+    # field values of an annotation as written to csv, rows compare equal when the csv lines would
+    return (row['type'],) + tuple(str(row[k]) if row.get(k) else '' for k in ROW_FIELDS)
+
+
+def ReadAnnotations(csv_path):
+    # tick -> RowValues of an annotation csv, empty if it does not exist
+    if not os.path.exists(csv_path):
+        return {}
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        return {int(row['tick']): RowValues(row) for row in csv.DictReader(f)}
+
+
+def WriteAnnotations(csv_path, rows, videoname):
+    # write tick -> RowValues atomically, readers never see a half-written csv
+    tmp_path = csv_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for tick in sorted(rows):
+            values = rows[tick]
+            writer.writerow([tick, values[0], videoname] + list(values[1:]))
+    os.replace(tmp_path, csv_path)
+
+
+def MergeAnnotations(base, ours, theirs):
+    '''Three-way merge of annotations at tick granularity.
+
+    base is the csv as this annotator loaded it, ours the edited annotations and theirs the csv on disk now. A tick
+    changed on one side only takes that change, a tick changed differently on both sides keeps ours and is returned
+    in conflicts as (tick, ours, theirs), None meaning the tick was removed on that side.
+    '''
+    merged = {}
+    conflicts = []
+    for tick in sorted(set(base) | set(ours) | set(theirs)):
+        b, o, t = base.get(tick), ours.get(tick), theirs.get(tick)
+        if o == t or t == b:
+            result = o
+        elif o == b:
+            result = t
+        else:
+            result = o if o is not None else t
+            conflicts.append((tick, o, t))
+        if result is not None:
+            merged[tick] = result
+    return merged, conflicts
+
+
+def WriteConflicts(csv_path, conflicts, videoname):
+    '''Save the other side of conflicting ticks next to the csv, return the path
+    '''
+    folder = joined(os.path.dirname(csv_path), 'conflicts')
+    os.makedirs(folder, exist_ok=True)
+    stem = os.path.split(csv_path)[-1][:-4]
+    out_path = joined(folder, f'{stem}_{time.strftime("%Y%m%d_%H%M%S")}.csv')
+    WriteAnnotations(out_path, {tick: t for tick, _, t in conflicts if t is not None}, videoname)
+    return out_path
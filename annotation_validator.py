@@ -0,0 +1,131 @@
+import os
+import re
+import csv
+import ast
+import json
+import time
+from os.path import join as joined
+from concurrent.futures import ProcessPoolExecutor
+import zlib
+from configs import GBL_CONF
+from comment_grammar import CommentGrammar, SPAN_TEXT
+from image_annotation import GetRegionStats
+from mask_store import MaskStore
+from frame_store import FrameStore
+
+TAG_LIKE = re.compile(r"\b(?:\d|frm)@\S*") # free text which looks like a field, usually an unknown key
+
+
+def _issue(issues, tick, kind, message):
+    issues.append({'tick': tick, 'kind': kind, 'message': message})
+
+
+def _check_comment(grammar, tick, row, issues):
+    comment = row.get('comment') or ''
+    spans = grammar.tokenize(comment)
+    for s, e, kind in spans:
+        if kind == SPAN_TEXT:
+            for m in TAG_LIKE.finditer(comment[s:e]):
+                _issue(issues, tick, 'comment_grammar', f'无法识别的字段: {m.group(0)}')
+    # attributes are derived from comment fields, see VideoAnnotator.OnFinishComment
+    info = grammar.parse(comment, spans)
+    sample_attr, frame_attr = [], ''
+    for field in info['fields']:
+        num, attr = field.split('@')
+        if num == 'frm':
+            frame_attr = attr
+        else:
+            sample_attr.append((num, attr))
+    sample_attr = ';'.join([s[1] for s in sorted(sample_attr, key=lambda x:x[0])])
+    if comment != '' and sample_attr != (row.get('sample_attr') or ''):
+        _issue(issues, tick, 'sample_attr', f'sample_attr={row.get("sample_attr")!r}, 由comment得到{sample_attr!r}')
+    if comment != '' and frame_attr != (row.get('frame_attr') or ''):
+        _issue(issues, tick, 'frame_attr', f'frame_attr={row.get("frame_attr")!r}, 由comment得到{frame_attr!r}')
+    return [int(num) for num, _ in (f.split('@') for f in info['fields']) if num != 'frm']
+
+
+def _check_image(frames, masks, video_name, tick, row, sample_nums, issues):
+    img_name = row.get('img_name') or ''
+    if img_name == '':
+        _issue(issues, tick, 'missing_image', 'type=image但img_name为空')
+        return
+    if not frames.has(img_name):
+        _issue(issues, tick, 'missing_image', f'原图不存在: {frames.folder}中的{img_name}')
+    try:
+        mask = masks.get(img_name)
+    except (OSError, ValueError, zlib.error) as e:
+        _issue(issues, tick, 'missing_image', f'标注无法读取: {img_name} ({e})')
+        return
+    if mask is None:
+        _issue(issues, tick, 'missing_image', f'标注不存在: {masks.folder}中的{img_name}')
+        return
+    n_region, anchors, _ = GetRegionStats(mask)
+    if str(n_region) != (row.get('region_count') or ''):
+        _issue(issues, tick, 'region_count', f'region_count={row.get("region_count")!r}, 标注图中有{n_region}个区域')
+    try:
+        saved_anchors = [tuple(a) for a in ast.literal_eval(row.get('anchors') or '[]')]
+    except (ValueError, SyntaxError, TypeError):
+        _issue(issues, tick, 'anchors', f'anchors无法解析: {row.get("anchors")!r}')
+    else:
+        if saved_anchors != anchors:
+            _issue(issues, tick, 'anchors', f'anchors与标注图不一致, 保存{len(saved_anchors)}个, 标注图{len(anchors)}个')
+    for num in sample_nums:
+        if num < 1 or num > n_region:
+            _issue(issues, tick, 'comment_grammar', f'区域编号{num}超出范围(1~{n_region})')
+
+
+def validate_csv(csv_path, sample_keys, frame_keys):
+    '''Check one annotation csv, return a report entry. Runs in a worker process.
+    '''
+    grammar = CommentGrammar(sample_keys, frame_keys)
+    video_name = os.path.split(csv_path)[-1][:-4] + '.mp4'
+    masks = MaskStore(joined('video_output', video_name, 'annotated_imgs'))
+    frames = FrameStore(joined('video_output', video_name, 'origin_imgs'), str.split(video_name, '.')[0])
+    issues = []
+    n_rows = 0
+    try:
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                n_rows += 1
+                try:
+                    tick = int(row['tick'])
+                except (KeyError, TypeError, ValueError):
+                    _issue(issues, None, 'format', f'无效的tick: {row.get("tick")!r}')
+                    continue
+                sample_nums = _check_comment(grammar, tick, row, issues)
+                if row.get('type') == 'image':
+                    _check_image(frames, masks, video_name, tick, row, sample_nums, issues)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        _issue(issues, None, 'format', f'无法读取: {e}')
+    if not os.path.exists(joined('video_input', video_name)):
+        _issue(issues, None, 'missing_video', f'视频不存在: {video_name}')
+    return {'csv': csv_path, 'video': video_name, 'rows': n_rows, 'issues': issues}
+
+
+def validate_project(report_path='validation_report.json', workers=None):
+    '''Validate all csv files in video_annotation with a process pool and write a json report
+    '''
+    conf = GBL_CONF['video_annotation']['comment']
+    csv_paths = sorted(joined('video_annotation', p) for p in os.listdir('video_annotation') if p.endswith('.csv')) \
+        if os.path.exists('video_annotation') else []
+    start = time.time()
+    results = []
+    if len(csv_paths) > 0:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(validate_csv, p, conf['sample_keys'], conf['frame_keys']) for p in csv_paths]
+            results = [f.result() for f in futures]
+    n_issues = sum(len(r['issues']) for r in results)
+    report = {
+        'sample_keys': conf['sample_keys'],
+        'frame_keys': conf['frame_keys'],
+        'files': len(results),
+        'rows': sum(r['rows'] for r in results),
+        'issues': n_issues,
+        'seconds': round(time.time() - start, 3),
+        'results': [r for r in results if len(r['issues']) > 0],
+    }
+    with open(report_path, 'w', encoding='utf-8') as fp:
+        json.dump(report, fp, ensure_ascii=False, indent=2)
+    print(f'检查了{report["files"]}个文件, {report["rows"]}条标注, 发现{n_issues}个问题, 用时{report["seconds"]}s')
+    print(f'报告已保存到{report_path}')
+    return report
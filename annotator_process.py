@@ -0,0 +1,91 @@
+import multiprocessing as mp
+import numpy as np
+
+
+def _annotator_main(conn):
+    '''Worker process: run one ImageAnnotator session per request, send region stats and mask back.
+
+    With warm_annotator the annotator of the last video is kept and reopened on the next frame of the same video.
+    '''
+    import cv2
+    from configs import GBL_CONF
+    from image_annotation import ImageAnnotator, GetRegionStats
+    from mask_store import MaskStore
+    from profiler import PROFILER
+    warm = GBL_CONF['video_annotation']['warm_annotator']
+    session = None
+    while True:
+        # keep the idle window responsive between sessions
+        while session is not None and not conn.poll(0.05):
+            cv2.waitKey(1)
+        try:
+            params = conn.recv()
+        except EOFError:
+            break
+        if params is None:
+            break
+        if session is not None and (session.img_dir, session.save_folder) == (params['img_dir'], params['save_folder']):
+            session.reopen(params['init_img_name'])
+        else:
+            session = ImageAnnotator(addi_params=dict(params, keep_window=warm))
+            if not warm or len(session.img_names) == 0:
+                session = None
+        result = {'img_name': params['init_img_name'], 'saved': False}
+        mask = MaskStore(params['save_folder']).get(params['init_img_name'])
+        if mask is not None:
+            n_region, anchors, _ = GetRegionStats(mask)
+            result.update({
+                'saved': True,
+                'region_count': n_region,
+                'anchors': anchors,
+                'mask_shape': mask.shape,
+                'mask': np.packbits(mask), # 1 bit per pixel
+            })
+        conn.send(result)
+    PROFILER.dump() # atexit does not run in multiprocessing children
+
+
+class AnnotatorProcess():
+    '''Image annotation sessions run in a separate process, so the blocking HighGUI loop never stalls the wx main loop.
+
+    The wx side sends the frame to annotate through a pipe and polls for the result without blocking.
+    '''
+    def __init__(self) -> None:
+        self.proc = None
+        self.conn = None
+        self.busy = False
+
+    def start_session(self, params):
+        if self.proc is None or not self.proc.is_alive():
+            ctx = mp.get_context('spawn') # never fork a process holding wx and libvlc state
+            self.conn, child_conn = ctx.Pipe()
+            self.proc = ctx.Process(target=_annotator_main, args=(child_conn,), daemon=True)
+            self.proc.start()
+        self.conn.send(params)
+        self.busy = True
+
+    def poll(self):
+        # return result dict if the session is finished, or None
+        if not self.busy:
+            return None
+        if self.conn.poll():
+            self.busy = False
+            result = self.conn.recv()
+            if result.get('saved'):
+                result['mask'] = np.unpackbits(result['mask'])[:np.prod(result['mask_shape'])].reshape(result['mask_shape']).astype(bool)
+            return result
+        if not self.proc.is_alive(): # annotator crashed, the session is over
+            self.busy = False
+            print('注意：图像标注进程意外退出')
+            return {'saved': False}
+        return None
+
+    def close(self):
+        if self.proc is not None and self.proc.is_alive():
+            try:
+                self.conn.send(None)
+            except (OSError, BrokenPipeError):
+                pass
+            self.proc.join(timeout=1.0)
+            if self.proc.is_alive():
+                self.proc.terminate()
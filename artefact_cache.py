@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from file_lock import FileLock
+
+INDEX_NAME = 'index.json'
+SAMPLE_BYTES = 1 << 20 # large files are identified by size, head and tail
+FULL_HASH_LIMIT = 8 << 20
+MAX_SOURCE_MEMOS = 50000
+UNTRACKED_GRACE_S = 24 * 3600 # untracked files may still be written by another annotator
+
+
+class ArtefactCache():
+    '''Persistent content-addressed store for derived artefacts (comment renders, thumbnails, region stats, proxies).
+
+    Each entry is keyed by the identity of its source file and the artefact kind, so it stays valid across sessions
+    and renamed files. Total size is bounded by max_size_mb, the least recently used entries are evicted first, except
+    pinned entries which are in use (e.g. the thumbnail atlas or the proxy being played). Several annotators may share
+    the cache, the index is merged with the one on disk under a file lock.
+    '''
+    def __init__(self, root='video_cache', max_size_mb=8192) -> None:
+        self.root = root
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.lock = threading.RLock()
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.entries = {} # key -> {'kind', 'path', 'size', 'atime'}
+        self.sources = {} # 'path|size|mtime' -> source id
+        self.pinned = set() # keys never evicted
+        self.removed = set() # keys evicted or lost since the last save, dropped from the index on disk too
+        self._dirty = False
+        os.makedirs(root, exist_ok=True)
+        try:
+            with FileLock(self.index_path):
+                self.entries, self.sources = self.read_index()
+                self.remove_untracked()
+        except TimeoutError as e:
+            print(f'注意：{e}, 本次不清理缓存')
+            self.entries, self.sources = self.read_index()
+
+    def read_index(self):
+        # (entries, sources) on disk
+        if not os.path.exists(self.index_path):
+            return {}, {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as fp:
+                index = json.load(fp)
+            return index.get('entries', {}), index.get('sources', {})
+        except (OSError, ValueError):
+            print(f'注意：{self.index_path}损坏, 缓存将被重建')
+            return {}, {}
+
+    def _newest_mtime(self, path):
+        try:
+            mtime = os.path.getmtime(path)
+            if os.path.isdir(path):
+                for d, _, fs in os.walk(path):
+                    mtime = max([mtime] + [os.path.getmtime(os.path.join(d, f)) for f in fs])
+            return mtime
+        except OSError:
+            return time.time()
+
+    def remove_untracked(self, grace_s=UNTRACKED_GRACE_S):
+        # files written by older versions and partial files left by a crash (e.g. *.tmp.mp4 of proxies, unfinished
+        # thumbnails) are not in the index and would never be evicted. Only files untouched for grace_s are removed,
+        # younger ones may be written by another annotator right now
+        tracked = set(os.path.normpath(e['path']) for e in self.entries.values())
+        deadline = time.time() - grace_s
+        def sweep(path):
+            if os.path.normpath(path) not in tracked and self._newest_mtime(path) < deadline:
+                self._remove(path)
+        for name in os.listdir(self.root):
+            p = os.path.join(self.root, name)
+            if name.startswith(INDEX_NAME): # index, its lock and temporary files
+                continue
+            if not os.path.isdir(p):
+                sweep(p)
+                continue
+            for shard in os.listdir(p): # <kind>/<key[:2]>/<key><ext>
+                shard_path = os.path.join(p, shard)
+                if not os.path.isdir(shard_path):
+                    sweep(shard_path)
+                    continue
+                for entry in os.listdir(shard_path):
+                    sweep(os.path.join(shard_path, entry))
+
+    def _remove(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def pin(self, key):
+        # entry of key is in use, evict() skips it until unpin
+        with self.lock:
+            self.pinned.add(key)
+
+    def unpin(self, key):
+        with self.lock:
+            self.pinned.discard(key)
+
+    def source_id(self, path):
+        # identity of source file, hashed only once for the same path, size and mtime
+        stat = os.stat(path)
+        memo = f'{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}'
+        with self.lock:
+            if memo in self.sources:
+                return self.sources[memo]
+        h = hashlib.sha1(str(stat.st_size).encode())
+        with open(path, 'rb') as fp:
+            if stat.st_size <= FULL_HASH_LIMIT:
+                h.update(fp.read())
+            else:
+                h.update(fp.read(SAMPLE_BYTES))
+                fp.seek(stat.st_size // 2)
+                h.update(fp.read(SAMPLE_BYTES))
+                fp.seek(-SAMPLE_BYTES, os.SEEK_END)
+                h.update(fp.read(SAMPLE_BYTES))
+        sid = h.hexdigest()
+        with self.lock:
+            self.sources[memo] = sid
+            self._dirty = True
+        return sid
+
+    def key(self, source_path, kind, params=''):
+        return self.content_key(self.source_id(source_path), kind, params)
+
+    def content_key(self, content_id, kind, params=''):
+        # key of an artefact whose source is not a single file, content_id identifies the source content
+        return hashlib.sha1(f'{content_id}:{kind}:{params}'.encode()).hexdigest()
+
+    def path(self, kind, key, ext=''):
+        # where the artefact should be written, call commit() after writing
+        folder = os.path.join(self.root, kind, key[:2])
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, key + ext)
+
+    def get(self, kind, key):
+        # return path of a committed artefact, or None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry['kind'] != kind:
+                return None
+            if not os.path.exists(entry['path']):
+                self.entries.pop(key)
+                self.removed.add(key)
+                self._dirty = True
+                return None
+            entry['atime'] = time.time()
+            self._dirty = True
+            return entry['path']
+
+    def commit(self, kind, key, path):
+        # register a written file or folder, then evict old entries if the cache is too large
+        if os.path.isdir(path):
+            size = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(path) for f in fs)
+        else:
+            size = os.path.getsize(path)
+        with self.lock:
+            self.entries[key] = {'kind': kind, 'path': path, 'size': size, 'atime': time.time()}
+            self.removed.discard(key)
+            self._dirty = True
+            self.evict(keep=key)
+            self.save()
+
+    def get_json(self, kind, key):
+        path = self.get(kind, key)
+        if path is None:
+            return None
+        with open(path, 'r', encoding='utf-8') as fp:
+            return json.load(fp)
+
+    def put_json(self, kind, key, value):
+        path = self.path(kind, key, '.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump(value, fp)
+        os.replace(tmp_path, path)
+        self.commit(kind, key, path)
+
+    def evict(self, keep=None):
+        with self.lock:
+            total = sum(e['size'] for e in self.entries.values())
+            for key in sorted(self.entries, key=lambda k: self.entries[k]['atime']):
+                if total <= self.max_size:
+                    break
+                if key == keep or key in self.pinned:
+                    continue
+                entry = self.entries.pop(key)
+                self.removed.add(key)
+                total -= entry['size']
+                self._remove(entry['path'])
+                self._dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self._dirty:
+                return
+            try:
+                with FileLock(self.index_path):
+                    # entries committed by other annotators are kept, the newest access time wins
+                    entries, sources = self.read_index()
+                    for key in self.removed:
+                        entries.pop(key, None)
+                    for key, entry in self.entries.items():
+                        if key not in entries or entries[key]['atime'] <= entry['atime']:
+                            entries[key] = entry
+                    self.entries = entries
+                    self.sources = sources | self.sources
+                    # keep the newest memos only, they are cheap to rebuild
+                    if len(self.sources) > MAX_SOURCE_MEMOS:
+                        self.sources = dict(list(self.sources.items())[-MAX_SOURCE_MEMOS:])
+                    tmp_path = self.index_path + '.tmp'
+                    with open(tmp_path, 'w', encoding='utf-8') as fp:
+                        json.dump({'entries': self.entries, 'sources': self.sources}, fp)
+                    os.replace(tmp_path, self.index_path)
+            except TimeoutError as e:
+                print(f'注意：{e}, 缓存索引稍后保存')
+                return
+            self.removed = set()
+            self._dirty = False
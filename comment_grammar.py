@@ -0,0 +1,72 @@
+import re
+import os
+
+SPAN_SAMPLE = 'sample' # <region number>@<sample keys>, e.g. 1@OK,HARD
+SPAN_FRAME = 'frame' # frm@<frame keys>, e.g. frm@P1
+SPAN_TEXT = 'text' # free-form comment
+
+
+class CommentGrammar():
+    '''Grammar of comments built from sample keys and frame keys in configs.yml.
+
+    The pattern is compiled once. tokenize() produces typed spans with offsets in one linear pass.
+    '''
+    def __init__(self, sample_keys, frame_keys) -> None:
+        self.sample_keys = list(sample_keys)
+        self.frame_keys = list(frame_keys)
+        sample_tag_body = r"\b(?:" + '|'.join(self.sample_keys) + r")\b(?:,\b(?:" \
+            + '|'.join(self.sample_keys) + r")\b)*"
+        frame_tag_body = r"\b(?:" + '|'.join(self.frame_keys) + r")\b(?:,\b(?:" \
+            + '|'.join(self.frame_keys) + r")\b)*"
+        self.pattern = r"\d" + "@" + sample_tag_body + "|" + 'frm' + "@" + frame_tag_body
+        self.regex = re.compile(r"(?P<sample>\d@" + sample_tag_body + r")|(?P<frame>frm@" + frame_tag_body + ")")
+
+    def tokenize(self, text):
+        # return list of (start, end, kind), spans cover the whole text
+        spans = []
+        pos = 0
+        for m in self.regex.finditer(text):
+            if m.start() > pos:
+                spans.append((pos, m.start(), SPAN_TEXT))
+            spans.append((m.start(), m.end(), SPAN_SAMPLE if m.lastgroup == 'sample' else SPAN_FRAME))
+            pos = m.end()
+        if pos < len(text):
+            spans.append((pos, len(text), SPAN_TEXT))
+        return spans
+
+    def parse(self, text, spans=None):
+        # return comment info: original comment, matched fields and unmatched free text
+        if spans is None:
+            spans = self.tokenize(text)
+        fields = [text[s:e] for s, e, kind in spans if kind != SPAN_TEXT]
+        unmatched = ' '.join([text[s:e] for s, e, kind in spans if kind == SPAN_TEXT and text[s:e].strip() != ''])
+        return {
+            'comment': str.strip(text), # original comment
+            'fields': fields,
+            'unmatched': str.strip(unmatched),
+        }
+
+
+def changed_spans(old_text, old_spans, new_text, new_spans, cursor=None):
+    '''Return spans of new_text which need restyling after an edit.
+
+    Text before and after the edited range keeps its style in the text control, so spans lying entirely in the common
+    prefix or the (shifted) common suffix are skipped. An edit of repeated text is ambiguous (deleting 'K O' from
+    'OK OK' looks like deleting ' OK'), cursor is the insertion point after the edit and pins the edit to where it
+    happened. Spans touching the edited range are restyled too, in case cursor is not known.
+    '''
+    max_common = min(len(old_text), len(new_text))
+    # the edit ends at the cursor, nothing after it can belong to the edit
+    max_suffix = max_common if cursor is None else max(0, min(max_common, len(new_text) - cursor))
+    suffix = 0
+    while suffix < max_suffix and old_text[-1 - suffix] == new_text[-1 - suffix]:
+        suffix += 1
+    prefix = len(os.path.commonprefix([old_text[:len(old_text) - suffix], new_text[:len(new_text) - suffix]]))
+    delta = len(new_text) - len(old_text)
+    unchanged = set()
+    for s, e, kind in old_spans:
+        if e < prefix:
+            unchanged.add((s, e, kind))
+        elif s > len(old_text) - suffix:
+            unchanged.add((s + delta, e + delta, kind))
+    return [span for span in new_spans if span not in unchanged]
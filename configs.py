@@ -1,14 +1,106 @@
-import os, yaml, platform
+import os, pickle, platform
 
 isWin = platform.system() == 'Windows'
 isMacOS = platform.system() == 'Darwin'
 
+# configs.yml is resolved relative to the install directory, not the working directory
+CONF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'configs.yml')
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__', 'configs.yml.cache')
+CACHE_VERSION = 1
+
+# expected type of every key, nested dicts are sections
+SCHEMA = {
+    'image_annotation': {
+        'init_resize': {'windows': (int, float), 'macOS': (int, float)},
+        'reverse_mouse_wheel': bool,
+        'wheel_zoom_factor': list,
+        'scale_range': list,
+        'watch_mode_alpha': (int, float),
+        'save_blank': bool,
+        'fill': {'method': str, 'margin': int, 'max_pixels': int, 'iterations': int},
+        'propagation': {'auto': bool, 'max_tick_distance': int, 'scale': (int, float), 'tiles': int, 'workers': int},
+        'undo': {'checkpoint_every': int, 'max_steps': int},
+        'progressive': {'enable': bool, 'reduction': int, 'min_kb': int},
+        'frame_cache': int,
+    },
+    'video_annotation': {
+        'selector_reverse_mouse_wheel': bool,
+        'selector_reverse_time_direction': bool,
+        'pause_after_seek': bool,
+        'cache': {'max_size_mb': (int, float)},
+        'probe_workers': int,
+        'seek': {'tolerance_ms': int, 'timeout_ms': int},
+        'proxy': {'enable': bool, 'height': int, 'crf': int, 'workers': int},
+        'frame_buffer': {'enable': bool, 'budget_mb': (int, float)},
+        'thumbnail': {'enable': bool, 'width': int, 'height': int, 'workers': int, 'chunk_seconds': int},
+        'frame_store': {'enable': bool},
+        'lock': {'timeout_s': (int, float)},
+        'warm_annotator': bool,
+        'comment': {'sample_keys': list, 'frame_keys': list},
+    },
+    'duplicate': {'enable': bool, 'max_distance': int, 'skip_on_next': bool, 'workers': int},
+    'codec': {tier: {'format': str, 'quality': int, 'compression': int} for tier in ['frames', 'renders', 'export']},
+    'profile': {'enable': bool, 'buffer_size': int, 'output_dir': str},
+}
+
+
+def validate(conf, schema=SCHEMA, prefix=''):
+    # return list of errors
+    errors = []
+    if not isinstance(conf, dict):
+        return [f'{prefix or "configs.yml"}应该是一个字典']
+    for key, expected in schema.items():
+        name = prefix + key
+        if key not in conf:
+            errors.append(f'缺少{name}')
+        elif isinstance(expected, dict):
+            errors += validate(conf[key], expected, name + '.')
+        elif not isinstance(conf[key], expected) or (expected is int and isinstance(conf[key], bool)):
+            errors.append(f'{name}的类型错误: {conf[key]!r}')
+    return errors
+
+
 class Configs():
-    def __init__(self) -> None:
-        with open('configs.yml', 'r', encoding='utf-8') as fp:
-            self.conf = yaml.load(fp, Loader=yaml.FullLoader)
-    
+    '''Parsed configs.yml, loaded on first access.
+
+    The validated form is cached and reused until configs.yml changes, so startup does not need to import yaml.
+    '''
+    def __init__(self, path=CONF_PATH, cache_path=CACHE_PATH) -> None:
+        self.path = path
+        self.cache_path = cache_path
+        self.conf = None
+
+    def load(self):
+        stat = os.stat(self.path)
+        stamp = (CACHE_VERSION, stat.st_size, stat.st_mtime_ns)
+        try:
+            with open(self.cache_path, 'rb') as fp:
+                cached_stamp, conf = pickle.load(fp)
+            if cached_stamp == stamp:
+                self.conf = conf
+                return self.conf
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            pass
+        import yaml
+        with open(self.path, 'r', encoding='utf-8') as fp:
+            conf = yaml.load(fp, Loader=yaml.FullLoader)
+        errors = validate(conf)
+        if len(errors) > 0:
+            raise ValueError(f'{self.path}配置错误:\n' + '\n'.join(errors))
+        self.conf = conf
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'wb') as fp:
+                pickle.dump((stamp, conf), fp)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass # read-only install, parse every time
+        return self.conf
+
     def __getitem__(self, index):
+        if self.conf is None:
+            self.load()
         return self.conf[index]
-    
-GBL_CONF = Configs()
\ No newline at end of file
+
+GBL_CONF = Configs()
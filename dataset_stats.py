@@ -0,0 +1,179 @@
+import os
+import csv
+import json
+import time
+import html
+import zlib
+from os.path import join as joined
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from mask_store import MaskStore
+
+AREA_CACHE_NAME = 'mask_areas.json'
+PERCENTILES = [0, 5, 25, 50, 75, 95, 100]
+
+
+def _packed_area(store, name):
+    # (area, h, w) of a mask, stored masks are counted without unpacking, the padding bits of packbits are zero
+    record = store.masks.get(name)
+    if record is not None and hasattr(np, 'bitwise_count'):
+        offset, length, h, w, _ = record
+        try:
+            with open(os.path.join(store.folder, store.data_name), 'rb') as fp:
+                fp.seek(offset)
+                packed = np.frombuffer(zlib.decompress(fp.read(length)), dtype=np.uint8)
+            return int(np.bitwise_count(packed).sum()), h, w
+        except (OSError, zlib.error):
+            pass # compacted by another process, read it again below
+    mask = store.get(name)
+    return int(mask.sum()), mask.shape[0], mask.shape[1]
+
+
+def video_mask_areas(video_name, names):
+    '''Area (pixels), height and width of the masks of names, cached in video_output/<video>/mask_areas.json by mask
+    digest. Runs in a worker process.
+    '''
+    cache_path = joined('video_output', video_name, AREA_CACHE_NAME)
+    cache = {}
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as fp:
+                cache = json.load(fp)
+        except (OSError, ValueError):
+            pass
+    store = MaskStore(joined('video_output', video_name, 'annotated_imgs'))
+    result = {}
+    changed = False
+    for name in names:
+        digest = store.digest(name)
+        if digest is None:
+            continue
+        if name in cache and cache[name][0] == digest:
+            result[name] = cache[name][1:]
+            continue
+        area = _packed_area(store, name)
+        cache[name] = [digest, *area]
+        result[name] = list(area)
+        changed = True
+    if changed:
+        try:
+            tmp_path = cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as fp:
+                json.dump(cache, fp)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return result
+
+
+def ReadColumns(csv_paths):
+    '''Read annotation csv files into columns, one numpy array per csv field plus the csv index of each row
+    '''
+    columns = {k: [] for k in ['file', 'tick', 'type', 'img_name', 'region_count', 'sample_attr', 'frame_attr']}
+    for idx, csv_path in enumerate(csv_paths):
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                columns['file'].append(idx)
+                columns['tick'].append(int(row['tick']))
+                columns['region_count'].append(int(row['region_count']) if (row.get('region_count') or '').isdigit() else -1)
+                for k in ['type', 'img_name', 'sample_attr', 'frame_attr']:
+                    columns[k].append(row.get(k) or '')
+    return {k: np.array(v, dtype=np.int64 if k in ['file', 'tick', 'region_count'] else str) for k, v in columns.items()}
+
+
+def _counts(values):
+    keys, counts = np.unique(values, return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    return {str(keys[i]): int(counts[i]) for i in order}
+
+
+def _distribution(values):
+    if len(values) == 0:
+        return {}
+    return {f'p{p}': round(float(v), 6) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))} | \
+        {'mean': round(float(np.mean(values)), 6)}
+
+
+def build_stats(csv_paths, workers=None):
+    start = time.time()
+    video_names = [os.path.split(p)[-1][:-4] + '.mp4' for p in csv_paths]
+    cols = ReadColumns(csv_paths)
+    is_image = cols['type'] == 'image'
+    # mask areas, one task per video
+    areas = np.full((len(cols['tick']), 3), -1, dtype=np.int64) # area, h, w
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for idx, video_name in enumerate(video_names):
+            rows = np.flatnonzero(is_image & (cols['file'] == idx))
+            if len(rows) > 0:
+                futures[idx] = (rows, pool.submit(video_mask_areas, video_name, cols['img_name'][rows].tolist()))
+        for idx, (rows, future) in futures.items():
+            result = future.result()
+            for r in rows.tolist():
+                areas[r] = result.get(cols['img_name'][r], [-1, -1, -1])
+    has_mask = areas[:, 0] >= 0
+    ratio = areas[has_mask, 0] / np.maximum(1, areas[has_mask, 1] * areas[has_mask, 2])
+    # per video totals with bincount over the file column
+    n_files = len(csv_paths)
+    per_video = {video_names[i]: {'annotations': int(a), 'images': int(b), 'masks': int(c)} for i, (a, b, c) in enumerate(zip(
+        np.bincount(cols['file'], minlength=n_files), np.bincount(cols['file'][is_image], minlength=n_files),
+        np.bincount(cols['file'][has_mask], minlength=n_files)))}
+    tags = [t for s in cols['sample_attr'][is_image].tolist() for t in s.split(';') if t != '']
+    region_counts = cols['region_count'][is_image & (cols['region_count'] >= 0)]
+    return {
+        'videos': len(csv_paths),
+        'annotations': int(len(cols['tick'])),
+        'images': int(is_image.sum()),
+        'missing_masks': int((is_image & ~has_mask).sum()),
+        'per_video': per_video,
+        'frame_attr': _counts(np.where(cols['frame_attr'][is_image] == '', '(none)', cols['frame_attr'][is_image])),
+        'sample_attr': _counts(np.array(tags, dtype=str)) if len(tags) > 0 else {},
+        'region_count': {'total': int(region_counts.sum()), 'histogram': {str(k): v for k, v in
+            sorted((int(k), v) for k, v in _counts(region_counts).items())}, 'distribution': _distribution(region_counts)},
+        'mask_area_px': _distribution(areas[has_mask, 0]),
+        'mask_area_ratio': _distribution(ratio),
+        'seconds': round(time.time() - start, 3),
+    }
+
+
+def _html_table(title, rows, header):
+    cells = ''.join(f'<tr>{"".join(f"<td>{html.escape(str(c))}</td>" for c in row)}</tr>' for row in rows)
+    return f'<h2>{html.escape(title)}</h2><table><tr>{"".join(f"<th>{h}</th>" for h in header)}</tr>{cells}</table>'
+
+
+def _html_counts(title, counts, header):
+    total = max(1, sum(counts.values()))
+    rows = [(k, v, f'{100*v/total:.1f}%', '█' * round(40 * v / total)) for k, v in counts.items()]
+    return _html_table(title, rows, header + ['%', ''])
+
+
+def WriteHtml(stats, html_path):
+    parts = [_html_table('Summary', [(k, stats[k]) for k in ['videos', 'annotations', 'images', 'missing_masks', 'seconds']], ['', '']),
+        _html_table('Videos', [(k, v['annotations'], v['images'], v['masks']) for k, v in stats['per_video'].items()],
+            ['video', 'annotations', 'images', 'masks']),
+        _html_counts('frame_attr', stats['frame_attr'], ['phase', 'images']),
+        _html_counts('sample_attr', stats['sample_attr'], ['tag', 'count']),
+        _html_counts('region_count', stats['region_count']['histogram'], ['regions', 'images']),
+        _html_table('Distributions', [(name, *[stats[k].get(p, '') for p in [f'p{p}' for p in PERCENTILES] + ['mean']])
+            for name, k in [('mask area (px)', 'mask_area_px'), ('mask area ratio', 'mask_area_ratio')]] +
+            [('region count', *[stats['region_count']['distribution'].get(p, '') for p in [f'p{p}' for p in PERCENTILES] + ['mean']])],
+            [''] + [f'p{p}' for p in PERCENTILES] + ['mean'])]
+    style = 'body{font-family:sans-serif}table{border-collapse:collapse;margin-bottom:16px}td,th{border:1px solid #ccc;padding:2px 8px}'
+    with open(html_path, 'w', encoding='utf-8') as fp:
+        fp.write(f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Dataset statistics</title><style>{style}</style></head>'
+            f'<body><h1>Dataset statistics</h1>{"".join(parts)}</body></html>')
+
+
+def stats_project(report_path='dataset_stats.json', workers=None):
+    '''Statistics of all csv files in video_annotation, written as json and as html next to it
+    '''
+    csv_paths = sorted(joined('video_annotation', p) for p in os.listdir('video_annotation') if p.endswith('.csv')) \
+        if os.path.exists('video_annotation') else []
+    stats = build_stats(csv_paths, workers)
+    with open(report_path, 'w', encoding='utf-8') as fp:
+        json.dump(stats, fp, ensure_ascii=False, indent=2)
+    html_path = os.path.splitext(report_path)[0] + '.html'
+    WriteHtml(stats, html_path)
+    print(f'{stats["videos"]}个视频, {stats["annotations"]}条标注, {stats["images"]}张标注图片, 用时{stats["seconds"]}s')
+    print(f'统计结果已保存到{report_path}和{html_path}')
+    return stats
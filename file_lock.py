@@ -0,0 +1,62 @@
+import os
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock():
+    '''Advisory lock on <path>.lock, shared by all annotators working on the same project folder.
+
+    Uses flock on Linux and macOS and msvcrt.locking on Windows. The lock is held by an open file, so it is released
+    by the OS if the process dies. Not reentrant: do not acquire the same path twice in one process.
+    '''
+    def __init__(self, path, timeout=10.0, poll=0.05) -> None:
+        self.lock_path = path + '.lock'
+        self.timeout = timeout
+        self.poll = poll
+        self.fp = None
+
+    def _try_lock(self):
+        try:
+            if os.name == 'nt':
+                self.fp.seek(0)
+                msvcrt.locking(self.fp.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(self.fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        self.fp = open(self.lock_path, 'a+b')
+        deadline = time.monotonic() + self.timeout
+        while not self._try_lock():
+            if time.monotonic() > deadline:
+                self.fp.close()
+                self.fp = None
+                raise TimeoutError(f'{self.lock_path}被其他程序锁定')
+            time.sleep(self.poll)
+
+    def release(self):
+        if self.fp is None:
+            return
+        try:
+            if os.name == 'nt':
+                self.fp.seek(0)
+                msvcrt.locking(self.fp.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.fp.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.fp.close()
+            self.fp = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
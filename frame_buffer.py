@@ -0,0 +1,148 @@
+import threading
+import bisect
+import cv2
+
+
+class FrameRingBuffer():
+    '''Decode frames around the current tick in a background thread.
+
+    Frames are resized to display size and kept in tick order. The number of frames is bounded by a memory budget,
+    so scrubbing inside the buffered window only needs a lookup instead of a player seek.
+    '''
+    def __init__(self, video_path, display_size, budget_mb=256) -> None:
+        self.video_path = video_path
+        self.budget_mb = budget_mb
+        self.cond = threading.Condition()
+        self.running = True
+        self.target = None
+        self.frame_ms = 1000.0 / 30.0
+        self.eof = False
+        self.failed_target = None # target which can not be decoded (e.g. out of video)
+        self.generation = 0
+        self.set_display_size(display_size)
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def set_display_size(self, display_size):
+        # frames with different size are useless, drop all of them
+        with self.cond:
+            self.display_size = (max(1, int(display_size[0])), max(1, int(display_size[1])))
+            w, h = self.display_size
+            self.capacity = max(8, int(self.budget_mb * 1024 * 1024 // (w * h * 3)))
+            self.ticks = [] # sorted ticks of decoded frames
+            self.frames = {} # tick -> RGB frame
+            self.generation += 1
+            self.cond.notify_all()
+
+    def request(self, tick):
+        # move the buffered window to tick, non-blocking
+        with self.cond:
+            if self.target != tick:
+                self.target = tick
+                self.cond.notify_all()
+
+    def get(self, tick):
+        # return the frame displayed at tick, or None if tick is out of the decoded window
+        with self.cond:
+            if len(self.ticks) == 0 or not (self.ticks[0] <= tick <= self.ticks[-1] + self.frame_ms):
+                return None
+            idx = bisect.bisect_right(self.ticks, tick) - 1
+            return self.frames[self.ticks[idx]]
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout=1.0)
+
+    def _window(self):
+        half = self.capacity * self.frame_ms / 2
+        return max(0, self.target - half), self.target + half
+
+    def _need_work(self):
+        if self.target is None:
+            return False
+        if len(self.ticks) == 0:
+            return self.target != self.failed_target
+        lo, hi = self._window()
+        if self.target < self.ticks[0] or (self.target > self.ticks[-1] and not self.eof):
+            return True
+        return (self.ticks[0] > lo + self.frame_ms and self.ticks[0] > self.frame_ms) or (self.ticks[-1] < hi - self.frame_ms and not self.eof)
+
+    def _decode(self, cap, until_tick, max_count):
+        # decode frames sequentially from current position, return list of (tick, frame)
+        result = []
+        while len(result) < max_count:
+            ret, frame = cap.read()
+            if not ret:
+                self.eof = True
+                break
+            tick = int(round(cap.get(cv2.CAP_PROP_POS_MSEC)))
+            frame = cv2.resize(frame, self.display_size, interpolation=cv2.INTER_AREA)
+            result.append((tick, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+            if tick >= until_tick:
+                break
+        return result
+
+    def _worker(self):
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            print(f'注意：无法打开{self.video_path}, 预览缓存不可用')
+            return
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.frame_ms = 1000.0 / fps if fps and fps > 0 else self.frame_ms
+        self.eof = False
+        last_tick = None # tick of the last decoded frame, next read() continues from here
+        batch = 8
+        while True:
+            with self.cond:
+                while self.running and not self._need_work():
+                    self.cond.wait()
+                if not self.running:
+                    break
+                generation = self.generation
+                lo, hi = self._window()
+                target = self.target
+                first = self.ticks[0] if len(self.ticks) > 0 else None
+                last = self.ticks[-1] if len(self.ticks) > 0 else None
+            if first is None or target < first or (target > last and not self.eof):
+                # target jumped out of the window: restart right before target, the window is filled later
+                cap.set(cv2.CAP_PROP_POS_MSEC, max(0, target - batch * self.frame_ms))
+                self.eof = False
+                decoded = self._decode(cap, target, self.capacity)
+                with self.cond:
+                    if generation == self.generation:
+                        self.ticks = [t for t, _ in decoded]
+                        self.frames = dict(decoded)
+                        self.failed_target = target if len(decoded) == 0 else None
+                last_tick = decoded[-1][0] if len(decoded) > 0 else None
+            elif last < hi - self.frame_ms and not self.eof:
+                # extend forward, drop the oldest frames
+                if last_tick != last:
+                    cap.set(cv2.CAP_PROP_POS_MSEC, last + 0.5 * self.frame_ms)
+                decoded = [(t, f) for t, f in self._decode(cap, hi, batch) if t > last]
+                last_tick = decoded[-1][0] if len(decoded) > 0 else last_tick
+                with self.cond:
+                    if generation == self.generation:
+                        for t, f in decoded:
+                            self.ticks.append(t)
+                            self.frames[t] = f
+                        while len(self.ticks) > self.capacity and self.ticks[0] < self.target - self.frame_ms:
+                            self.frames.pop(self.ticks.pop(0))
+            else:
+                # extend backward: seek before the first frame and decode a whole chunk up to it
+                chunk_ms = max(batch, self.capacity // 4) * self.frame_ms
+                start = max(0, first - chunk_ms)
+                cap.set(cv2.CAP_PROP_POS_MSEC, start)
+                self.eof = False
+                decoded = [(t, f) for t, f in self._decode(cap, first - 1, self.capacity) if t < first]
+                last_tick = None
+                with self.cond:
+                    if generation == self.generation:
+                        if len(decoded) == 0: # nothing before first frame
+                            decoded = [(0, self.frames[first])]
+                        self.ticks = [t for t, _ in decoded] + self.ticks
+                        self.frames.update(decoded)
+                        while len(self.ticks) > self.capacity and self.ticks[-1] > self.target + self.frame_ms:
+                            self.frames.pop(self.ticks.pop())
+        cap.release()
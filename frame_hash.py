@@ -0,0 +1,223 @@
+import os
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from configs import GBL_CONF
+from frame_store import FrameStore
+from image_codec import ReadImage
+
+CACHE_NAME = 'phash.npz'
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+POOL_MIN_FRAMES = 64 # fewer frames are hashed in process, a pool is slower to start
+
+
+def PHash(img):
+    '''64-bit DCT perceptual hash of a BGR image
+    '''
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:]) # DC term is left out of the median
+    return np.packbits(bits).view('>u8')[0].astype(np.uint64)
+
+
+def PopCount(x):
+    # number of set bits of each uint64
+    if hasattr(np, 'bitwise_count'): # numpy >= 2.0
+        return np.bitwise_count(x)
+    return POPCOUNT[x.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+def HammingDistance(hashes, h):
+    # distances between packed uint64 hashes and one hash
+    return PopCount(np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(h)))
+
+
+def _read_frame(frames, folder, name):
+    return frames.read(name) if frames is not None else ReadImage(os.path.join(folder, name))
+
+
+def _hash_frames(folder, stem, names):
+    # worker process
+    frames = FrameStore(folder, stem) if stem is not None else None
+    result = []
+    for name in names:
+        img = _read_frame(frames, folder, name)
+        result.append(int(PHash(img)) if img is not None else None)
+    return result
+
+
+def FrameHashes(folder, names, stem=None, workers=4):
+    '''Perceptual hashes of frames in folder, return (uint64 hashes, bool valid) aligned with names.
+
+    stem is given for frames of a video, they are read through FrameStore. Hashes are cached in folder/phash.npz and
+    only new or changed frames are hashed, in a process pool if there are many of them. valid is False for frames
+    which do not exist or can not be decoded.
+    '''
+    frames = FrameStore(folder, stem) if stem is not None else None
+    stamps = []
+    for name in names:
+        digest = frames.digest(name) if frames is not None else None
+        if digest is None:
+            try:
+                stat = os.stat(os.path.join(folder, name))
+                digest = f'{stat.st_size}:{stat.st_mtime_ns}'
+            except OSError:
+                digest = ''
+        stamps.append(digest)
+    cache_path = os.path.join(folder, CACHE_NAME)
+    cached = {}
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as data:
+                cached = {(n, s): h for n, s, h in zip(data['names'].tolist(), data['stamps'].tolist(), data['hashes'])}
+        except (OSError, ValueError, KeyError):
+            pass
+    hashes = np.zeros(len(names), dtype=np.uint64)
+    valid = np.array([s != '' for s in stamps], dtype=bool)
+    missing = []
+    for i, key in enumerate(zip(names, stamps)):
+        if key in cached:
+            hashes[i] = cached[key]
+        elif valid[i]:
+            missing.append(i)
+    if len(missing) > 0:
+        missing_names = [names[i] for i in missing]
+        if len(missing) < POOL_MIN_FRAMES:
+            computed = _hash_frames(folder, stem, missing_names)
+        else:
+            chunk = max(16, len(missing) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_hash_frames, folder, stem, missing_names[i:i+chunk]) for i in range(0, len(missing), chunk)]
+                computed = [h for f in futures for h in f.result()]
+        for i, h in zip(missing, computed):
+            if h is None:
+                valid[i] = False
+            else:
+                hashes[i] = h
+        # stale hashes of changed frames are dropped, frames not asked for this time are kept
+        current = set(names)
+        cached = {k: h for k, h in cached.items() if k[0] not in current}
+        cached.update({(n, s): hashes[i] for i, (n, s) in enumerate(zip(names, stamps)) if valid[i]})
+        try:
+            tmp_path = cache_path + '.tmp.npz'
+            keys = list(cached)
+            np.savez(tmp_path, names=np.array([k[0] for k in keys], dtype=str), stamps=np.array([k[1] for k in keys], dtype=str),
+                hashes=np.array([cached[k] for k in keys], dtype=np.uint64))
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass # read-only folder, hash again next time
+    return hashes, valid
+
+
+def GroupDuplicates(hashes, max_distance=4):
+    '''Group near-duplicate hashes, return int array of group ids (index of the first member of each group).
+
+    Hashes are split into max_distance + 1 bands, two hashes within max_distance agree on at least one band, so only
+    hashes sharing a band value are compared.
+    '''
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    uniq, inverse = np.unique(hashes, return_inverse=True) # identical frames are grouped for free
+    n = len(uniq)
+    parent = np.arange(n)
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    n_bands = max_distance + 1
+    bounds = np.linspace(0, 64, n_bands + 1).astype(int)
+    for b in range(n_bands):
+        width = bounds[b+1] - bounds[b]
+        band = (uniq >> np.uint64(bounds[b])) & np.uint64((1 << width) - 1)
+        order = np.argsort(band, kind='stable')
+        band_sorted = band[order]
+        # position of each sorted entry inside its bucket, and the bucket size
+        starts = np.flatnonzero(np.r_[True, band_sorted[1:] != band_sorted[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+        run_size = np.repeat(sizes, sizes)
+        run_pos = np.arange(n) - np.repeat(starts, sizes)
+        active = np.flatnonzero(run_size > 1)
+        k = 1
+        while len(active) > 0:
+            # pairs k apart in sorted order inside the same bucket
+            active = active[run_pos[active] + k < run_size[active]]
+            i, j = order[active], order[active + k]
+            close = PopCount(np.bitwise_xor(uniq[i], uniq[j])) <= max_distance
+            for a, c in zip(i[close].tolist(), j[close].tolist()):
+                ra, rc = find(a), find(c)
+                if ra != rc:
+                    parent[max(ra, rc)] = min(ra, rc)
+            k += 1
+    roots = parent.copy()
+    while True: # pointer jumping until every node points to its root
+        next_roots = roots[roots]
+        if (next_roots == roots).all():
+            break
+        roots = next_roots
+    # group id is the index of the first frame in the group
+    first = np.full(n, len(hashes), dtype=np.int64)
+    np.minimum.at(first, roots[inverse], np.arange(len(hashes)))
+    return first[roots[inverse]]
+
+
+def _valid_groups(hashes, valid, max_distance):
+    # group of every frame, unreadable frames are a group of their own
+    groups = np.arange(len(hashes))
+    kept = np.flatnonzero(valid)
+    groups[kept] = kept[GroupDuplicates(hashes[kept], max_distance)]
+    return groups
+
+
+def FolderDuplicateGroups(folder, names, stem=None, max_distance=4, workers=4):
+    '''Group near-duplicate frames of one folder, return (groups, hashes, valid) aligned with names, groups[i] is the
+    index of the first frame of the group of frame i
+    '''
+    hashes, valid = FrameHashes(folder, names, stem, workers)
+    return _valid_groups(hashes, valid, max_distance), hashes, valid
+
+
+def DuplicateGroups(entries, max_distance=4, workers=4):
+    '''Group near-duplicate frames of (video_name, img_name) entries, which may span several videos.
+
+    Return a list aligned with entries, each item is the (video_name, img_name) of the first frame of its group, or None
+    if the frame has no near duplicate or can not be read.
+    '''
+    by_video = {}
+    for idx, (video_name, img_name) in enumerate(entries):
+        by_video.setdefault(video_name, []).append(idx)
+    hashes = np.zeros(len(entries), dtype=np.uint64)
+    valid = np.zeros(len(entries), dtype=bool)
+    for video_name, indices in by_video.items():
+        folder = os.path.join('video_output', video_name, 'origin_imgs')
+        names = [entries[i][1] for i in indices]
+        hashes[indices], valid[indices] = FrameHashes(folder, names, str.split(video_name, '.')[0], workers)
+    groups = _valid_groups(hashes, valid, max_distance)
+    sizes = np.bincount(groups, minlength=len(entries))
+    return [entries[group] if sizes[group] > 1 else None for group in groups.tolist()]
+
+
+def find_duplicates(report_path='duplicates.json'):
+    '''Group near-duplicate frames across all videos and write a json report
+    '''
+    conf = GBL_CONF['duplicate']
+    entries = []
+    if os.path.exists('video_output'):
+        for video_name in sorted(os.listdir('video_output')):
+            folder = os.path.join('video_output', video_name, 'origin_imgs')
+            if os.path.exists(folder):
+                entries += [(video_name, n) for n in FrameStore(folder, str.split(video_name, '.')[0]).names()]
+    start = time.time()
+    groups = DuplicateGroups(entries, conf['max_distance'], conf['workers'])
+    result = {}
+    for entry, group in zip(entries, groups):
+        if group is not None:
+            result.setdefault(group, []).append({'video': entry[0], 'img_name': entry[1]})
+    result = list(result.values())
+    with open(report_path, 'w', encoding='utf-8') as fp:
+        json.dump({'frames': len(entries), 'max_distance': conf['max_distance'], 'groups': result}, fp, ensure_ascii=False, indent=2)
+    print(f'{len(entries)}帧中有{sum(len(g) for g in result)}帧属于{len(result)}组近似重复帧, 用时{time.time() - start:.1f}s')
+    print(f'报告已保存到{report_path}')
+    return result
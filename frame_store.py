@@ -0,0 +1,181 @@
+import os
+import mmap
+import hashlib
+import threading
+import numpy as np
+from file_lock import FileLock
+from image_codec import DecodeImage, SniffFormat
+
+DATA_NAME = 'frames.dat'
+INDEX_NAME = 'frames.idx.npy'
+INDEX_DTYPE = np.dtype([('tick', '<i8'), ('offset', '<i8'), ('length', '<i8'), ('digest', 'S20')])
+
+
+def TickOfName(name):
+    # <video>@<tick>.jpg
+    return int(name.split('@')[-1].split('.')[0])
+
+
+class FrameStore():
+    '''Captured frames of one video in a single append-only data file with a tick-sorted index.
+
+    Frames are kept as encoded bytes in any format of image_codec, reads go through a memory map of the data file.
+    JPEG files of the old layout in the same folder are still visible, pack() moves them into the store.
+    '''
+    def __init__(self, folder, stem) -> None:
+        self.folder = folder
+        self.stem = stem
+        self.data_path = os.path.join(folder, DATA_NAME)
+        self.index_path = os.path.join(folder, INDEX_NAME)
+        self.lock = threading.RLock()
+        self.stamp = None
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        self.mm = None
+        self.refresh()
+
+    def refresh(self):
+        # reload index if another process changed it
+        with self.lock:
+            try:
+                stat = os.stat(self.index_path)
+            except OSError:
+                self.stamp, self.index = None, np.zeros(0, dtype=INDEX_DTYPE)
+                return
+            stamp = (stat.st_size, stat.st_mtime_ns)
+            if stamp != self.stamp:
+                self.index = np.load(self.index_path)
+                self.stamp = stamp
+
+    def name(self, tick):
+        return f'{self.stem}@{tick}.jpg'
+
+    def legacy_names(self):
+        if not os.path.exists(self.folder):
+            return []
+        return [e.name for e in os.scandir(self.folder) if e.name.endswith('.jpg')]
+
+    def ticks(self):
+        self.refresh()
+        return self.index['tick']
+
+    def names(self, legacy=True):
+        # all frame names sorted by tick
+        self.refresh()
+        ticks = set(self.index['tick'].tolist())
+        if legacy:
+            ticks |= set(TickOfName(p) for p in self.legacy_names())
+        return [self.name(t) for t in sorted(ticks)]
+
+    def _find(self, tick):
+        # position in index, or -1
+        idx = np.searchsorted(self.index['tick'], tick)
+        if idx < len(self.index) and self.index['tick'][idx] == tick:
+            return idx
+        return -1
+
+    def has(self, name):
+        self.refresh()
+        with self.lock:
+            if self._find(TickOfName(name)) >= 0:
+                return True
+        return os.path.exists(os.path.join(self.folder, name))
+
+    def digest(self, name):
+        # sha1 of frame bytes in the store, None for frames of the old layout
+        self.refresh()
+        with self.lock:
+            idx = self._find(TickOfName(name))
+            return None if idx < 0 else self.index['digest'][idx].hex()
+
+    def _map(self, end):
+        # map the data file, remap if it has grown past the mapped range
+        if self.mm is None or len(self.mm) < end:
+            if self.mm is not None:
+                self.mm.close()
+            with open(self.data_path, 'rb') as fp:
+                self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mm
+
+    def read_bytes(self, name):
+        # encoded frame, or None
+        self.refresh()
+        with self.lock:
+            idx = self._find(TickOfName(name))
+            if idx >= 0:
+                offset, length = int(self.index['offset'][idx]), int(self.index['length'][idx])
+                return self._map(offset + length)[offset:offset + length]
+        path = os.path.join(self.folder, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as fp:
+                return fp.read()
+        return None
+
+    def read(self, name):
+        # BGR image, or None
+        return DecodeImage(self.read_bytes(name))
+
+    def __iter__(self):
+        # (name, BGR image) in tick order, the data file is read sequentially
+        for name in self.names():
+            yield name, self.read(name)
+
+    def put(self, tick, data):
+        os.makedirs(self.folder, exist_ok=True)
+        with self.lock, FileLock(self.index_path):
+            self.stamp = None
+            self.refresh()
+            with open(self.data_path, 'ab') as fp:
+                offset = fp.seek(0, os.SEEK_END)
+                fp.write(data)
+            record = np.array([(tick, offset, len(data), hashlib.sha1(data).digest())], dtype=INDEX_DTYPE)
+            idx = self._find(tick)
+            if idx >= 0: # replaced frame stays in the data file, frames are rarely captured twice
+                self.index[idx] = record[0]
+            else:
+                idx = np.searchsorted(self.index['tick'], tick)
+                self.index = np.insert(self.index, idx, record)
+            tmp_path = self.index_path + '.tmp.npy'
+            np.save(tmp_path, self.index)
+            os.replace(tmp_path, self.index_path)
+            stat = os.stat(self.index_path)
+            self.stamp = (stat.st_size, stat.st_mtime_ns)
+
+    def import_file(self, path, codec=None):
+        # move a frame file of the old layout into the store, transcoded when codec is given and of another format
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        if codec is not None and SniffFormat(data) != codec.format:
+            img = DecodeImage(data)
+            if img is not None:
+                data = codec.encode(img)
+        self.put(TickOfName(os.path.basename(path)), data)
+        os.remove(path)
+
+    def pack(self):
+        # move all frame files into the store, return number of frames
+        names = sorted(self.legacy_names(), key=TickOfName)
+        for name in names:
+            self.import_file(os.path.join(self.folder, name))
+        return len(names)
+
+    def close(self):
+        with self.lock:
+            if self.mm is not None:
+                self.mm.close()
+                self.mm = None
+
+
+def pack_frames():
+    '''Move frames in all video_output/*/origin_imgs folders into frame stores
+    '''
+    total = 0
+    if os.path.exists('video_output'):
+        for video_name in sorted(os.listdir('video_output')):
+            folder = os.path.join('video_output', video_name, 'origin_imgs')
+            if os.path.exists(folder):
+                count = FrameStore(folder, str.split(video_name, '.')[0]).pack()
+                if count > 0:
+                    print(f'{folder}: 打包了{count}张视频帧')
+                total += count
+    print(f'共打包了{total}张视频帧')
+    return total
@@ -1,29 +1,82 @@
 import cv2
 import os
+from collections import OrderedDict
 from configs import GBL_CONF, isWin, isMacOS
+from profiler import profiled
+from mask_store import MaskStore, GetAnnotatedMask, PaintMask
+from frame_store import FrameStore, TickOfName
+from mask_propagation import PropagateMask, ProposalFolder, NearestTick
+from frame_hash import FolderDuplicateGroups, PHash, HammingDistance
+from stroke_journal import StrokeJournal
+from image_codec import ImageCodec, ReadImage
+import numpy as np
 import random
+from concurrent.futures import ThreadPoolExecutor
 
+FILL_SEED_COLOR = (0, 255, 255) # stroke of assisted fill before it is refined (BGR)
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
 
-def GetCommentImg(img_path, out_path):
+
+def GetRegionStats(mask):
+    '''Return number of independent regions, anchor (row, col) of each region and label map
+    '''
+    ret, labels, _, centroids = cv2.connectedComponentsWithStats(mask.astype('uint8')*255, connectivity=4)
+    anchors = [(round(c[1]), round(c[0])) for c in centroids[1:]] # centroids are (col, row)
+    return ret - 1, anchors, labels
+
+
+def FillRegion(img, seed, method='grabcut', max_pixels=250000, iterations=3):
+    '''Refine a rough stroke into a region, img and seed are the ROI around the stroke. Return bool mask of the ROI
+
+    ROIs larger than max_pixels are segmented at reduced size, so the cost does not depend on frame resolution
+    '''
+    h, w = seed.shape
+    scale = min(1.0, (max_pixels / (h * w)) ** 0.5)
+    if scale < 1.0:
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        small_img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        small_seed = cv2.resize(seed, size, interpolation=cv2.INTER_NEAREST)
+    else:
+        small_img, small_seed = img, seed
+    if method == 'watershed':
+        markers = np.zeros(small_seed.shape, np.int32)
+        markers[[0, 1, -2, -1], :] = 1 # ROI border is background, watershed overwrites the outermost pixels
+        markers[:, [0, 1, -2, -1]] = 1
+        markers[small_seed > 0] = 2
+        cv2.watershed(cv2.GaussianBlur(small_img, (5, 5), 0), markers) # smooth noise, otherwise regions leak
+        region = markers == 2
+    else:
+        gc_mask = np.full(small_seed.shape, cv2.GC_PR_BGD, np.uint8)
+        gc_mask[[0, -1], :] = cv2.GC_BGD
+        gc_mask[:, [0, -1]] = cv2.GC_BGD
+        gc_mask[small_seed > 0] = cv2.GC_FGD
+        bgd_model, fgd_model = np.zeros((1, 65), np.float64), np.zeros((1, 65), np.float64)
+        cv2.grabCut(small_img, gc_mask, None, bgd_model, fgd_model, iterations, cv2.GC_INIT_WITH_MASK)
+        region = (gc_mask == cv2.GC_FGD) | (gc_mask == cv2.GC_PR_FGD)
+    if scale < 1.0:
+        region = cv2.resize(region.astype(np.uint8), (w, h), interpolation=cv2.INTER_NEAREST) > 0
+    return region | (seed > 0)
+
+
+def GetCommentImg(img, out_path, mask=None, codec=None):
     '''Create a special image that each neuron is colored with a different color and has a number on it
+
+    img is the original image (BGR) when mask is given, otherwise a painted image of the old layout, codec defaults to
+    JPEG of quality 100
     '''
-    img = cv2.imread(img_path) # WHBGR
-    target_map = (img[:,:,0] > 240) * (img[:,:,1] < 10) * (img[:,:,2] < 10) # WH
-    target_map = target_map.astype('int')*255
-    ret, labels = cv2.connectedComponents(target_map.astype('uint8'), connectivity=4)
-    anchors = []
-    for label in range(1, ret):
+    img = img.copy() # WHBGR
+    if mask is None:
+        mask = GetAnnotatedMask(img)
+    n_region, anchors, labels = GetRegionStats(mask)
+    for label in range(1, n_region + 1):
         random_color = [random.randint(0, 240), random.randint(100, 240), random.randint(0, 100)] # BGR
         reverse_color = [255 - c for c in random_color]
-        mask = labels == label
-        img[mask, :] = random_color
+        img[labels == label, :] = random_color
         # add number
-        x, y = (labels == label).nonzero()
-        x, y = round(x.mean()), round(y.mean())
-        anchors.append((x, y))
+        x, y = anchors[label - 1]
         img = cv2.putText(img, str(label), (y, x), cv2.FONT_HERSHEY_SIMPLEX, 3, reverse_color, 6)
-    cv2.imwrite(out_path, img, [cv2.IMWRITE_JPEG_QUALITY, 100])
-    return ret - 1, anchors # number of neuros
+    (codec or ImageCodec('jpeg', 100)).write(out_path, img)
+    return n_region, anchors # number of neuros
 
 
 class ImageAnnotator():
@@ -31,21 +84,38 @@ class ImageAnnotator():
         self.conf = GBL_CONF['image_annotation']
         # single image mode
         self.single_img_mode = False if not addi_params else addi_params['single_img_mode']
+        # warm session: the window is kept when a session ends, see reopen
+        self.keep_window = False if not addi_params else addi_params.get('keep_window', False)
 
         img_dir = "origin_imgs" if addi_params is None else addi_params['img_dir']
+        self.img_dir = img_dir
         if not os.path.exists(img_dir):
             os.makedirs(img_dir, exist_ok=True)
-        if self.single_img_mode: # sort by tick
-            self.img_names = sorted([p for p in os.listdir(img_dir) if p.endswith('.jpg')], key=lambda x: int(x.split('@')[-1].split('.')[0]))
+        if self.single_img_mode: # frames of a video, sorted by tick
+            self.frames = FrameStore(img_dir, addi_params['init_img_name'].rsplit('@', 1)[0])
+            self.img_names = self.frames.names()
+            self.img_ticks = np.array([TickOfName(n) for n in self.img_names], dtype=np.int64)
         else:
-            self.img_names = sorted([p for p in os.listdir(img_dir) if p.endswith('.jpg')])
+            self.frames = None
+            self.img_names = sorted([e.name for e in os.scandir(img_dir) if e.name.endswith('.jpg')])
         self.img_paths = [os.path.join(img_dir, p) for p in self.img_names]
         self.img_cache = {}
         self.saved_flag = {}
+        self.frame_cache = OrderedDict() # name -> decoded original, least recently used first
+        self.frame_cache_size = self.conf['frame_cache']
         self.save_folder = "annotated_imgs" if addi_params is None else addi_params['save_folder']
         if not os.path.exists(self.save_folder):
             os.makedirs(self.save_folder, exist_ok=True)
-        self.save_paths = [os.path.join(self.save_folder, p) for p in self.img_names]
+        self.masks = MaskStore(self.save_folder) # annotations are saved as masks, not painted images
+        self.build_status()
+        self.dup_groups = None # dup_groups[i] is the first image of the near-duplicate group of image i
+        if GBL_CONF['duplicate']['enable'] and len(self.img_names) > 0:
+            conf = GBL_CONF['duplicate']
+            stem = self.frames.stem if self.frames is not None else None
+            self.dup_groups, self.dup_hashes, self.dup_valid = FolderDuplicateGroups(img_dir, self.img_names, stem,
+                conf['max_distance'], conf['workers'])
+        self.proposals = MaskStore(ProposalFolder(self.save_folder)) # masks warped from neighbouring images
+        self.proposed = set() # indices showing a warped mask as starting layer
         if not addi_params:
             self.img_index = 0
         else:
@@ -67,8 +137,27 @@ class ImageAnnotator():
         self.drawing = False
         # watch mode
         self.watch_mode = False
+        # assisted fill: a stroke is refined into a region in a worker thread
+        self.fill_mode = False
+        self.fill_seed = None
+        self.fill_backup = None
+        self.fill_job = None # (future, image index, roi, image before the stroke)
+        self.fill_pool = ThreadPoolExecutor(max_workers=1)
+        # progressive loading: a reduced preview is shown while the full image is decoded in a worker thread
+        self.read_job = None # (future, image index, propose)
+        self.read_pool = ThreadPoolExecutor(max_workers=1)
+        # undo history of the current image
+        self.journal = None
         # save option
         self.dirty = False
+        self.open_window()
+        if len(self.img_names) == 0:
+            print('没有找到任何图片, 自动退出')
+            return
+        self.init_img(self.img_index)
+        self.main_loop()
+
+    def open_window(self):
         cv2.namedWindow(self.unique_name, cv2.WINDOW_NORMAL)
         if isWin:
             win_scale = self.conf['init_resize']['windows']
@@ -76,16 +165,99 @@ class ImageAnnotator():
             win_scale = self.conf['init_resize']['macOS']
         wh, ww = round(win_scale * 1080), round(win_scale * 1920)
         cv2.resizeWindow(self.unique_name, ww, wh)
-        if len(self.img_names) == 0:
-            print('没有找到任何图片, 自动退出')
-            return
+
+    def close_window(self):
+        if not self.keep_window:
+            cv2.destroyAllWindows()
+        else: # the idle window must not draw on the finished session
+            cv2.setMouseCallback(self.unique_name, lambda *args: None)
+
+    def reopen(self, init_img_name):
+        '''Run another single image session of the same video in this annotator.
+
+        The window, the tick-sorted frame list, annotation status, duplicate groups and decoded frames are kept, a frame
+        captured since the last session is inserted at its tick. Edits which were not saved are dropped.
+        '''
+        pos = int(np.searchsorted(self.img_ticks, TickOfName(init_img_name)))
+        if pos == len(self.img_names) or self.img_names[pos] != init_img_name:
+            self.insert_img(pos, init_img_name)
+        self.frame_cache.pop(init_img_name, None) # the frame may have been captured again
+        stamp = self.masks.stamp
+        self.masks.refresh()
+        if self.masks.stamp != stamp: # saved by another process
+            self.build_status()
+        self.img_cache.clear()
+        self.saved_flag.clear()
+        self.proposed.clear()
+        self.watch_mode = False
+        self.fill_job, self.fill_seed, self.fill_backup = None, None, None
+        try:
+            visible = cv2.getWindowProperty(self.unique_name, cv2.WND_PROP_VISIBLE) >= 1
+        except cv2.error:
+            visible = False
+        if not visible: # closed by the user
+            self.open_window()
+        self.img_index = pos
         self.init_img(self.img_index)
         self.main_loop()
 
+    def insert_img(self, pos, name):
+        # new frame of a warm session, status and duplicate group are computed for this frame only
+        self.img_names.insert(pos, name)
+        self.img_paths.insert(pos, os.path.join(self.img_dir, name))
+        self.img_ticks = np.insert(self.img_ticks, pos, TickOfName(name))
+        self.annotated = np.insert(self.annotated, pos, self.masks.has(name))
+        if self.dup_groups is None:
+            return
+        img = self.read_img(pos)
+        h = PHash(img) if img is not None else np.uint64(0)
+        close = np.flatnonzero(self.dup_valid & (HammingDistance(self.dup_hashes, h) <= GBL_CONF['duplicate']['max_distance']))
+        groups = np.where(self.dup_groups >= pos, self.dup_groups + 1, self.dup_groups)
+        close = np.where(close >= pos, close + 1, close)
+        self.dup_groups = np.insert(groups, pos, pos)
+        self.dup_hashes = np.insert(self.dup_hashes, pos, h)
+        self.dup_valid = np.insert(self.dup_valid, pos, img is not None)
+        if len(close) > 0 and img is not None: # join the groups of all near duplicates, the group id is the first member
+            merged = np.unique(self.dup_groups[close])
+            group = min(int(merged.min()), pos)
+            self.dup_groups[np.isin(self.dup_groups, merged)] = group
+            self.dup_groups[pos] = group
+
     def img_title(self):
         saved_status = ' (saved) ' if self.get_saved_flag() else ' '
         watch_status = ' (watch mode) ' if self.watch_mode else ' '
-        return f'[{self.img_index+1}/{len(self.img_paths)}]' + saved_status + watch_status + self.img_names[self.img_index]
+        watch_status += '(fill mode) ' if self.fill_mode else ''
+        progress = f' (done {int(self.annotated.sum())}/{len(self.img_names)})'
+        return f'[{self.img_index+1}/{len(self.img_paths)}]' + progress + self.dup_status() + saved_status + watch_status + self.img_names[self.img_index]
+
+    def dup_status(self):
+        # near duplicates of the current image, and the first of them which is already annotated
+        if self.dup_groups is None:
+            return ''
+        members = np.flatnonzero(self.dup_groups == self.dup_groups[self.img_index])
+        if len(members) < 2:
+            return ''
+        done = members[self.annotated[members] & (members != self.img_index)]
+        if len(done) > 0:
+            return f' (dup of [{done[0]+1}])'
+        return f' (dup x{len(members)})'
+
+    def build_status(self):
+        # one pass over the save folder, annotated[i] is True if img_names[i] has a saved annotation
+        saved = set(self.masks.names())
+        self.annotated = np.array([name in saved for name in self.img_names], dtype=bool)
+
+    def next_with_status(self, annotated):
+        # index of the next image after the current one with given status, wraps around, or None
+        order = np.roll(np.arange(len(self.img_names)), -(self.img_index + 1))[:-1]
+        status = self.annotated
+        if not annotated and self.dup_groups is not None and GBL_CONF['duplicate']['skip_on_next']:
+            # a duplicate of an annotated image does not need its own annotation
+            covered = np.zeros(len(self.img_names), dtype=bool)
+            covered[self.dup_groups[self.annotated]] = True
+            status = covered[self.dup_groups]
+        hits = order[status[order] == annotated]
+        return int(hits[0]) if len(hits) > 0 else None
     
     def get_saved_flag(self):
         # 只和本次程序启动后的保存情况有关，如果继续增加标注，则保存flag失效
@@ -94,12 +266,78 @@ class ImageAnnotator():
     def init_window(self):
         cv2.setMouseCallback(self.unique_name, self.mouse_callback, None) # type: ignore
     
-    def init_img(self, index):
+    def read_img(self, index):
+        name = self.img_names[index]
+        if name in self.frame_cache:
+            self.frame_cache.move_to_end(name)
+            return self.frame_cache[name].copy()
+        img = self.frames.read(name) if self.frames is not None else ReadImage(self.img_paths[index])
+        self.cache_frame(name, img)
+        return img
+
+    def cache_frame(self, name, img):
+        if img is None or self.frame_cache_size <= 0:
+            return
+        self.frame_cache[name] = img.copy()
+        while len(self.frame_cache) > self.frame_cache_size:
+            self.frame_cache.popitem(last=False)
+
+    def read_bytes(self, index):
+        if self.frames is not None:
+            return self.frames.read_bytes(self.img_names[index])
+        try:
+            with open(self.img_paths[index], 'rb') as fp:
+                return fp.read()
+        except OSError:
+            return None
+
+    def start_read(self, index, propose):
+        # show a reduced decode of large JPEGs at once and decode the full image in background, return False if the
+        # image is read in place instead
+        conf = self.conf['progressive']
+        if not conf['enable'] or self.img_names[index] in self.frame_cache:
+            return False
+        data = self.read_bytes(index)
+        if data is None or len(data) < conf['min_kb'] * 1024 or data[:2] != b'\xff\xd8':
+            return False
+        buf = np.frombuffer(data, dtype=np.uint8)
+        preview = cv2.imdecode(buf, REDUCED_FLAGS.get(conf['reduction'], cv2.IMREAD_REDUCED_COLOR_4))
+        if preview is None:
+            return False
+        cv2.imshow(self.unique_name, preview)
+        cv2.setWindowTitle(self.unique_name, self.img_title())
+        # full decode starts after the preview is shown, so the two do not compete for a core
+        self.read_job = (self.read_pool.submit(cv2.imdecode, buf, cv2.IMREAD_COLOR), index, propose)
+        return True
+
+    def finish_read(self):
+        # swap the full image in for the preview, nothing can be drawn before this
+        if self.read_job is None:
+            return
+        future, index, propose = self.read_job
+        self.read_job = None
+        self.real_img = future.result()
+        self.cache_frame(self.img_names[index], self.real_img)
+        if propose:
+            self.auto_propose(index)
+        self.show_img()
+
+    def init_img(self, index, propose=True):
+        self.read_job = None
         if index not in self.img_cache.keys():
-            self.real_img = cv2.imread(self.img_paths[index])
+            self.proposed.discard(index)
+            if self.start_read(index, propose):
+                return
+            self.real_img = self.read_img(index)
+            if propose:
+                self.auto_propose(index)
         else:
             self.real_img = self.img_cache[index].copy()
+        self.show_img()
+
+    def show_img(self):
         self.display_img = self.real_img.copy()
+        self.reset_journal()
         
         cv2.imshow(self.unique_name, self.real_img)
         self.dirty = False
@@ -117,6 +355,64 @@ class ImageAnnotator():
             self.watch_mode = False
             self.turn_on_watch_mode()
 
+    def reset_journal(self):
+        # the current real_img becomes the state undo goes back to
+        conf = self.conf['undo']
+        self.journal = StrokeJournal(self.real_img, self.color, conf['checkpoint_every'], conf['max_steps'])
+
+    def undo(self, redo=False):
+        self.finish_fill()
+        self.turn_off_watch_mode()
+        self.journal.end_stroke()
+        if not (self.journal.can_redo() if redo else self.journal.can_undo()):
+            print('没有可以重做的操作' if redo else '没有可以撤销的操作')
+            return
+        self.real_img = self.journal.redo() if redo else self.journal.undo()
+        self.dirty = self.journal.can_undo()
+        self.saved_flag[self.img_index] = False
+        h, w = self.real_img.shape[:2]
+        self.rescale_window(w//2, h//2, 1.0, self.scale)
+        cv2.setWindowTitle(self.unique_name, self.img_title())
+
+    def nearest_annotated(self, index):
+        # index of the closest annotated image, or None. Frames of a video are compared by tick and must be within
+        # max_tick_distance, images of a folder are unrelated photos, the neighbour in name order is only used for P key
+        candidates = np.flatnonzero(self.annotated)
+        candidates = candidates[candidates != index]
+        if len(candidates) == 0:
+            return None
+        if not self.single_img_mode:
+            return int(candidates[np.argmin(np.abs(candidates - index))])
+        pos = NearestTick(self.img_ticks[candidates], int(self.img_ticks[index]), self.conf['propagation']['max_tick_distance'])
+        return None if pos is None else int(candidates[pos])
+
+    def auto_propose(self, index):
+        # frames of a video without annotation start with the proposal saved by propagate, optical flow is computed
+        # here only when propagation.auto is on
+        if self.single_img_mode and not self.annotated[index]:
+            self.propose_mask(index, compute=self.conf['propagation']['auto'])
+
+    def propose_mask(self, index, use_saved=True, compute=True):
+        # paint the mask of the nearest annotated image, warped by optical flow, as starting layer of real_img
+        mask = self.proposals.get(self.img_names[index]) if use_saved else None
+        if mask is None:
+            if not compute:
+                return False
+            src = self.nearest_annotated(index)
+            if src is None:
+                return False
+            src_img, src_mask = self.read_img(src), self.masks.get(self.img_names[src])
+            if src_mask is None or src_img.shape != self.real_img.shape:
+                return False
+            conf = self.conf['propagation']
+            mask = PropagateMask(src_img, src_mask, self.real_img, conf['scale'], conf['tiles'], conf['workers'])
+        if mask.shape != self.real_img.shape[:2] or not mask.any():
+            return False
+        self.real_img = PaintMask(self.real_img, mask, self.color)
+        self.proposed.add(index)
+        print(f'已载入标注建议{self.img_names[index]}, 修改后按S保存, 按R清除')
+        return True
+
     def shift_xy(self, x1, y1, x2, y2, h, w):
         if x1 < 0:
             x1, x2 = 0, x2 - x1
@@ -135,6 +431,7 @@ class ImageAnnotator():
         cv2.circle(canvas, (x, y), round(self.brush_size*self.scale), color, thickness)
         cv2.imshow(self.unique_name, canvas)
     
+    @profiled()
     def rescale_window(self, x, y, origin_scale, new_scale):
         h, w = self.real_img.shape[:2]
         #print(f'origin_scale: {origin_scale}, new_scale: {new_scale}')
@@ -168,13 +465,26 @@ class ImageAnnotator():
         self.display_img = cv2.resize(self.real_img[y1:y2, x1:x2 :], (w, h), interpolation=cv2.INTER_LINEAR)
         cv2.imshow(self.unique_name, self.display_img)
 
+    @profiled()
     def mouse_callback(self, event, x, y, flags, param):
+        if self.read_job is not None: # mouse coordinates of the preview do not match the full image
+            if event == cv2.EVENT_MOUSEMOVE and flags == 0:
+                return
+            self.finish_read()
         if event == cv2.EVENT_LBUTTONDOWN:
             if y > 20: # 拖动窗口时不会触发画图
                 self.turn_off_watch_mode()
                 self.drawing = True
                 self.saved_flag[self.img_index] = False
+                if self.fill_mode:
+                    self.finish_fill()
+                    self.fill_backup = self.real_img.copy()
+                    self.fill_seed = np.zeros(self.real_img.shape[:2], np.uint8)
         elif event == cv2.EVENT_LBUTTONUP:
+            if self.drawing and self.fill_mode:
+                self.start_fill()
+            elif self.drawing:
+                self.journal.end_stroke()
             self.drawing = False
         elif event == cv2.EVENT_RBUTTONDOWN: # start dragging
             self.dragging = True
@@ -195,8 +505,13 @@ class ImageAnnotator():
                 xm, ym = (self.scale_center[0] + (x - 0.5*w) / self.scale, self.scale_center[1] + (y - 0.5*h) / self.scale)
                 xm, ym = round(xm), round(ym)
                 # print(f'xm: {xm}, ym: {ym}')
-                self.dirty = True
-                cv2.circle(canvas, (xm, ym), self.brush_size, self.color, -1)
+                if self.fill_mode: # only seeds the fill, painted after refinement
+                    cv2.circle(self.fill_seed, (xm, ym), self.brush_size, 1, -1)
+                    cv2.circle(canvas, (xm, ym), self.brush_size, FILL_SEED_COLOR, -1)
+                else:
+                    self.dirty = True
+                    cv2.circle(canvas, (xm, ym), self.brush_size, self.color, -1)
+                    self.journal.add_stamp(xm, ym, self.brush_size, self.scale)
                 self.real_img = canvas
                 self.rescale_window(w // 2, h // 2, 1.0, self.scale)  
         elif event == cv2.EVENT_MOUSEMOVE:
@@ -219,26 +534,62 @@ class ImageAnnotator():
             self.draw_circle(xm, ym)
             self.scale = newscale
     
+    def start_fill(self):
+        # refine the stroke inside its bounding box plus margin
+        if self.fill_seed is None or not self.fill_seed.any():
+            return
+        conf = self.conf['fill']
+        h, w = self.fill_seed.shape
+        margin = max(conf['margin'], 2 * self.brush_size)
+        ys, xs = np.nonzero(self.fill_seed)
+        x1, y1 = max(0, xs.min() - margin), max(0, ys.min() - margin)
+        x2, y2 = min(w, xs.max() + margin + 1), min(h, ys.max() + margin + 1)
+        future = self.fill_pool.submit(FillRegion, self.fill_backup[y1:y2, x1:x2].copy(), self.fill_seed[y1:y2, x1:x2].copy(),
+            conf['method'], conf['max_pixels'], conf['iterations'])
+        self.fill_job = (future, self.img_index, (x1, y1, x2, y2), self.fill_backup)
+        self.fill_seed, self.fill_backup = None, None
+
+    def finish_fill(self):
+        # wait for the pending fill and merge its region into the image
+        if self.fill_job is None:
+            return
+        future, index, (x1, y1, x2, y2), backup = self.fill_job
+        self.fill_job = None
+        region = future.result()
+        if index != self.img_index:
+            return
+        self.real_img = backup
+        self.real_img[y1:y2, x1:x2][region] = self.color
+        self.journal.add_fill((x1, y1, x2, y2), region)
+        self.dirty = True
+        self.saved_flag[self.img_index] = False
+        h, w = self.real_img.shape[:2]
+        self.rescale_window(w//2, h//2, 1.0, self.scale)
+        cv2.setWindowTitle(self.unique_name, self.img_title())
+
     def turn_off_watch_mode(self):
+        self.finish_read()
         if not self.watch_mode:
             return
         self.watch_mode = False
         if self.img_index in self.img_cache.keys():
             self.real_img = self.img_cache[self.img_index].copy()
         else:
-            self.real_img = cv2.imread(self.img_paths[self.img_index])
+            self.real_img = self.read_img(self.img_index)
         h, w = self.real_img.shape[:2]
         self.rescale_window(w//2, h//2, 1.0, self.scale)
         cv2.setWindowTitle(self.unique_name, self.img_title())
 
     def turn_on_watch_mode(self):
+        self.finish_read()
         if self.watch_mode:
             return
-        if os.path.exists(self.save_paths[self.img_index]):
+        mask = self.masks.get(self.img_names[self.img_index])
+        if mask is not None:
             self.watch_mode = True
             self.img_cache[self.img_index] = self.real_img.copy()
-            s_img = cv2.imread(self.save_paths[self.img_index])
-            origin_img = cv2.imread(self.img_paths[self.img_index])
+            origin_img = self.read_img(self.img_index)
+            s_img = PaintMask(origin_img, mask, self.color)
             # 将该图层与原图叠加
             self.real_img = cv2.addWeighted(origin_img, 1-self.conf['watch_mode_alpha'], s_img, self.conf['watch_mode_alpha'], 0)
             h, w = self.real_img.shape[:2]
@@ -263,13 +614,36 @@ class ImageAnnotator():
             if isWin and cv2.getWindowProperty(self.unique_name, cv2.WND_PROP_VISIBLE) < 1:
                 cv2.destroyAllWindows()
                 return
-            key = cv2.waitKey(0)
-            if key == ord('q'): # decrease brush size
+            # poll while fill mode is on or a full image is loading, both finish without any key
+            key = cv2.waitKey(30 if self.fill_mode or self.read_job is not None else 0)
+            if self.read_job is not None and (self.read_job[0].done() or key != -1):
+                self.finish_read()
+            if self.fill_job is not None and (self.fill_job[0].done() or key != -1):
+                self.finish_fill()
+            if key == -1:
+                continue
+            if key == ord('f'): # toggle assisted fill
+                self.fill_mode = not self.fill_mode
+                cv2.setWindowTitle(self.unique_name, self.img_title())
+            elif key == ord('z') or key == ord('y'): # undo / redo one stroke
+                self.undo(redo=key == ord('y'))
+            elif key == ord('q'): # decrease brush size
                 self.brush_size = round(max(self.min_size, self.brush_size * 0.7))
                 self.draw_circle(self.last_mouse_xy[0], self.last_mouse_xy[1])
             elif key == ord('r'): # reset
                 self.img_cache.pop(self.img_index, None)
-                self.init_img(self.img_index)
+                self.init_img(self.img_index, propose=False)
+            elif key == ord('p'): # warp the nearest annotation onto this image
+                self.turn_off_watch_mode()
+                painted_img = self.real_img
+                self.real_img = self.read_img(self.img_index)
+                if self.propose_mask(self.img_index, use_saved=False):
+                    self.reset_journal()
+                    h, w = self.real_img.shape[:2]
+                    self.rescale_window(w//2, h//2, 1.0, self.scale)
+                else: # keep the unsaved strokes
+                    self.real_img = painted_img
+                    print('注意：没有可以传播的标注')
             elif key == ord('e'): # increase brush size
                 self.brush_size = round(min(100, self.brush_size / 0.7))
                 self.draw_circle(self.last_mouse_xy[0], self.last_mouse_xy[1])
@@ -287,6 +661,14 @@ class ImageAnnotator():
                     if self.single_img_mode and self.dirty: # save image in this mode
                         self.save_img()
                     self.select_img(new_index)
+            elif key == ord('n') or key == ord('m'): # next unannotated / annotated image
+                new_index = self.next_with_status(key == ord('m'))
+                if new_index is None:
+                    print('没有其他未标注的图片了' if key == ord('n') else '没有其他已标注的图片了')
+                else:
+                    if self.single_img_mode and self.dirty: # save image in this mode
+                        self.save_img()
+                    self.select_img(new_index)
             elif key == ord('-') or key == ord('='):
                 if key == ord('-'):
                     new_index = max(0, self.img_index - 10)
@@ -299,7 +681,7 @@ class ImageAnnotator():
                 self.turn_off_watch_mode()
                 self.save_img()
                 if self.single_img_mode:
-                    cv2.destroyAllWindows()
+                    self.close_window()
                     return
                 else:
                     self.img_cache[self.img_index] = self.real_img.copy()
@@ -311,16 +693,21 @@ class ImageAnnotator():
                     else:
                         print('已经是最后一张图片了')
             elif key == 27:
-                cv2.destroyAllWindows()
+                self.close_window()
                 return
     
+    @profiled()
     def save_img(self):
         if (not self.dirty) and (self.conf['save_blank'] == False):
-            print('注意：当前图片没有进行任何标注，不保存')
+            # a proposal must be edited at least once, otherwise it is saved by accident
+            print('注意：标注建议没有修改，不保存' if self.img_index in self.proposed else '注意：当前图片没有进行任何标注，不保存')
             return
-        result = cv2.imwrite(self.save_paths[self.img_index], self.real_img, [cv2.IMWRITE_JPEG_QUALITY, 100])
-        if result:
+        # painted pixels are exact in memory, the mask keeps sharp edges
+        mask = np.all(self.real_img == np.array(self.color, dtype=self.real_img.dtype), axis=2)
+        try:
+            self.masks.put(self.img_names[self.img_index], mask)
             self.saved_flag[self.img_index] = True
-        else:
-            print(f'注意：保存{self.save_paths[self.img_index]}时出现错误')
-        print(f'已保存[{self.img_index+1}/{len(self.img_paths)}]{self.save_paths[self.img_index]}')
+            self.annotated[self.img_index] = True
+        except OSError as e:
+            print(f'注意：保存{self.img_names[self.img_index]}时出现错误: {e}')
+        print(f'已保存[{self.img_index+1}/{len(self.img_paths)}]{os.path.join(self.save_folder, self.img_names[self.img_index])}')
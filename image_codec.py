@@ -0,0 +1,169 @@
+import io
+import os
+import json
+import time
+from os.path import join as joined
+import cv2
+import numpy as np
+from configs import GBL_CONF
+
+NPY_MAGIC = b'\x93NUMPY'
+FORMATS = {'jpeg': '.jpg', 'png': '.png', 'webp': '.webp', 'npy': '.npy'}
+# formats wx.Image can show, comment renders are painted by the video annotator
+RENDER_FORMATS = ['jpeg', 'png']
+
+
+def SniffFormat(data):
+    # format of encoded bytes, None if unknown
+    head = bytes(data[:12])
+    if head[:2] == b'\xff\xd8':
+        return 'jpeg'
+    if head[:4] == b'\x89PNG':
+        return 'png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[:6] == NPY_MAGIC:
+        return 'npy'
+    return None
+
+
+class ImageCodec():
+    '''Encoder of one storage format.
+
+    jpeg uses quality (0-100, lossy), png uses compression (0-9, lossless, higher is smaller and slower), webp is
+    always lossless and npy is the raw array. Decoding does not need the codec, DecodeImage detects the format.
+    '''
+    def __init__(self, format='jpeg', quality=95, compression=3) -> None:
+        if format not in FORMATS:
+            raise ValueError(f'不支持的图片格式: {format}, 可选: {", ".join(FORMATS)}')
+        self.format = format
+        self.ext = FORMATS[format]
+        if format == 'jpeg':
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+            self.name = f'jpeg-q{quality}'
+        elif format == 'png':
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, int(compression)]
+            self.name = f'png-c{compression}'
+        elif format == 'webp':
+            self.params = [cv2.IMWRITE_WEBP_QUALITY, 101] # above 100 is lossless
+            self.name = 'webp-lossless'
+        else:
+            self.params = []
+            self.name = 'npy'
+
+    def encode(self, img):
+        if self.format == 'npy':
+            buf = io.BytesIO()
+            np.save(buf, np.ascontiguousarray(img), allow_pickle=False)
+            return buf.getvalue()
+        ok, buf = cv2.imencode(self.ext, img, self.params)
+        if not ok:
+            raise ValueError(f'无法编码为{self.name}')
+        return buf.tobytes()
+
+    def write(self, path, img):
+        with open(path, 'wb') as fp:
+            fp.write(self.encode(img))
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+def DecodeImage(data, flags=cv2.IMREAD_COLOR):
+    # BGR image from bytes of any supported format, or None
+    if data is None:
+        return None
+    if bytes(data[:6]) == NPY_MAGIC:
+        try:
+            return np.load(io.BytesIO(data), allow_pickle=False)
+        except ValueError:
+            return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+
+
+def ReadImage(path, flags=cv2.IMREAD_COLOR):
+    # like cv2.imread, also reads npy frames and non-ASCII paths on Windows
+    try:
+        with open(path, 'rb') as fp:
+            return DecodeImage(fp.read(), flags)
+    except OSError:
+        return None
+
+
+def GetCodec(tier, formats=None):
+    '''Codec of a storage tier in configs.yml codec section: frames, renders or export
+    '''
+    conf = GBL_CONF['codec'][tier]
+    if formats is not None and conf['format'] not in formats:
+        print(f'注意：{tier}不支持{conf["format"]}格式, 使用png')
+        return ImageCodec('png', compression=conf['compression'])
+    return ImageCodec(conf['format'], conf['quality'], conf['compression'])
+
+
+BENCH_CODECS = [('jpeg', 100, 0), ('jpeg', 95, 0), ('jpeg', 90, 0), ('jpeg', 80, 0),
+    ('png', 0, 1), ('png', 0, 3), ('png', 0, 6), ('png', 0, 9), ('webp', 0, 0), ('npy', 0, 0)]
+
+
+def SampleImages(samples):
+    '''Up to samples project frames spread over all videos, as (kind, BGR image). Frames with a saved mask are also
+    sampled painted, as written by export.
+    '''
+    from frame_store import FrameStore
+    from mask_store import MaskStore, PaintMask
+    videos = sorted(os.listdir('video_output')) if os.path.exists('video_output') else []
+    stores = [(v, FrameStore(joined('video_output', v, 'origin_imgs'), str.split(v, '.')[0])) for v in videos]
+    stores = [(v, s, s.names()) for v, s in stores]
+    stores = [entry for entry in stores if len(entry[2]) > 0]
+    result = []
+    per_video = max(1, -(-samples // max(1, len(stores))))
+    for video_name, frames, names in stores:
+        masks = MaskStore(joined('video_output', video_name, 'annotated_imgs'))
+        for i in np.linspace(0, len(names) - 1, min(per_video, len(names))).astype(int).tolist():
+            img = frames.read(names[i])
+            if img is None:
+                continue
+            result.append(('frame', img))
+            mask = masks.get(names[i])
+            if mask is not None and mask.shape == img.shape[:2]:
+                result.append(('painted', PaintMask(img, mask)))
+            if sum(kind == 'frame' for kind, _ in result) >= samples:
+                return result
+    return result
+
+
+def benchmark_codecs(report_path='codec_benchmark.json', samples=20):
+    '''Encode/decode time and file size of every codec setting on real project frames, written as json
+    '''
+    images = SampleImages(samples)
+    if len(images) == 0:
+        print('注意：video_output中没有视频帧')
+        return {}
+    report = {}
+    for kind in sorted(set(k for k, _ in images)):
+        imgs = [img for k, img in images if k == kind]
+        raw = sum(img.nbytes for img in imgs)
+        rows = []
+        for format, quality, compression in BENCH_CODECS:
+            codec = ImageCodec(format, quality, compression)
+            encode_s, decode_s, size, error = 0.0, 0.0, 0, 0.0
+            for img in imgs:
+                start = time.perf_counter()
+                data = codec.encode(img)
+                encode_s += time.perf_counter() - start
+                start = time.perf_counter()
+                decoded = DecodeImage(data)
+                decode_s += time.perf_counter() - start
+                size += len(data)
+                error = max(error, float(np.abs(decoded.astype(np.int16) - img).mean()))
+            rows.append({'codec': codec.name, 'encode_ms': round(1000 * encode_s / len(imgs), 2),
+                'decode_ms': round(1000 * decode_s / len(imgs), 2), 'size_kb': round(size / len(imgs) / 1024, 1),
+                'ratio': round(size / raw, 4), 'mean_abs_error': round(error, 3)})
+        report[kind] = {'images': len(imgs), 'shape': list(imgs[0].shape), 'codecs': rows}
+        print(f'{kind}: {len(imgs)}张, {imgs[0].shape[1]}x{imgs[0].shape[0]}')
+        print(f'{"codec":<16}{"encode ms":>10}{"decode ms":>10}{"size KB":>10}{"ratio":>8}{"error":>8}')
+        for r in rows:
+            print(f'{r["codec"]:<16}{r["encode_ms"]:>10}{r["decode_ms"]:>10}{r["size_kb"]:>10}{r["ratio"]:>8}{r["mean_abs_error"]:>8}')
+    with open(report_path, 'w', encoding='utf-8') as fp:
+        json.dump(report, fp, ensure_ascii=False, indent=2)
+    print(f'测试结果已保存到{report_path}')
+    return report
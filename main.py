@@ -1,15 +1,57 @@
-
-from image_annotation import ImageAnnotator
-from video_annotation import start_video_annotation
 import argparse
+import importlib
+import sys
+import time
+
+HEAVY_MODULES = ['cv2', 'numpy', 'yaml', 'wx', 'vlc', 'win32file']
+
+
+def import_mode(module_name, show_time=False):
+    # each mode imports only its own modules, so image mode never loads wx or vlc
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if show_time:
+        loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+        print(f'import {module_name}: {(time.perf_counter() - start)*1000:.1f}ms, loaded: {", ".join(loaded)}')
+    return module
 
 # 调用主函数
 if __name__ == "__main__":
+    modules = {'image': 'image_annotation', 'video': 'video_annotation', 'validate': 'annotation_validator',
+        'migrate': 'mask_store', 'propagate': 'mask_propagation', 'duplicates': 'frame_hash',
+        'stats': 'dataset_stats', 'codecs': 'image_codec', 'export': 'mask_store'}
     parser = argparse.ArgumentParser()
-    parser.add_argument('--type', type=str, default='image', help='image or video')
+    parser.add_argument('--type', type=str, default='image', choices=list(modules), help='mode to run')
+    parser.add_argument('--report', type=str, default=None, help='report path of validate, duplicates, stats or codecs')
+    parser.add_argument('--video', type=str, default=None, help='video name of propagate, all videos if not given')
+    parser.add_argument('--ticks', type=str, default=None, help='comma separated ticks of propagate')
+    parser.add_argument('--import-time', action='store_true', help='only print time of config loading and imports of the mode')
     args = parser.parse_args()
-    if args.type == 'image':
-        tool = ImageAnnotator(addi_params=None)
+    if args.import_time: # only measure startup of the mode, do not run it
+        from configs import GBL_CONF
+        start = time.perf_counter()
+        GBL_CONF.load()
+        print(f'load configs: {(time.perf_counter() - start)*1000:.1f}ms')
+        import_mode(modules[args.type], show_time=True)
+    elif args.type == 'image':
+        tool = import_mode('image_annotation').ImageAnnotator(addi_params=None)
     elif args.type == 'video':
-        start_video_annotation()
-
+        import_mode('video_annotation').start_video_annotation()
+    elif args.type == 'validate':
+        import_mode('annotation_validator').validate_project(args.report or 'validation_report.json')
+    elif args.type == 'migrate':
+        import_mode('mask_store').migrate_masks()
+        from configs import GBL_CONF
+        if GBL_CONF['video_annotation']['frame_store']['enable']:
+            import_mode('frame_store').pack_frames()
+    elif args.type == 'propagate':
+        ticks = [int(t) for t in args.ticks.split(',')] if args.ticks else None
+        import_mode('mask_propagation').propagate_project(args.video, ticks)
+    elif args.type == 'duplicates':
+        import_mode('frame_hash').find_duplicates(args.report or 'duplicates.json')
+    elif args.type == 'stats':
+        import_mode('dataset_stats').stats_project(args.report or 'dataset_stats.json')
+    elif args.type == 'export':
+        import_mode('mask_store').export_masks()
+    elif args.type == 'codecs':
+        import_mode('image_codec').benchmark_codecs(args.report or 'codec_benchmark.json')
@@ -0,0 +1,134 @@
+import os
+import csv
+from os.path import join as joined
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from configs import GBL_CONF
+from mask_store import MaskStore
+from frame_store import FrameStore, TickOfName
+from image_codec import ImageCodec, GetCodec
+
+_pool = None
+
+
+def get_pool(workers):
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=workers) # cv2 releases the GIL while computing flow
+    return _pool
+
+
+def _band_flow(prev, next, y0, y1, pad):
+    # flow of rows [y0, y1), computed with padding so band borders match the full image
+    a, b = max(0, y0 - pad), min(prev.shape[0], y1 + pad)
+    flow = cv2.calcOpticalFlowFarneback(prev[a:b], next[a:b], None, 0.5, 3, 15, 3, 5, 1.2, 0)
+    return flow[y0 - a:y1 - a]
+
+
+def DenseFlow(prev, next, tiles=4, workers=4):
+    '''Farneback flow from prev to next (gray images), split into horizontal bands computed in a thread pool
+    '''
+    h = prev.shape[0]
+    tiles = max(1, min(tiles, h // 32))
+    bounds = np.linspace(0, h, tiles + 1).astype(int)
+    pool = get_pool(workers)
+    futures = [pool.submit(_band_flow, prev, next, bounds[i], bounds[i+1], 32) for i in range(tiles)]
+    return np.concatenate([f.result() for f in futures], axis=0)
+
+
+def PropagateMask(src_img, src_mask, dst_img, scale=0.25, tiles=4, workers=4):
+    '''Warp the mask of src_img onto dst_img (BGR images of the same size), return bool mask of dst_img
+    '''
+    h, w = dst_img.shape[:2]
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    src_gray = cv2.cvtColor(cv2.resize(src_img, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    dst_gray = cv2.cvtColor(cv2.resize(dst_img, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    # backward flow: dst(y, x) ~ src(y + fy, x + fx), so every dst pixel samples the source mask
+    flow = DenseFlow(dst_gray, src_gray, tiles, workers)
+    flow = cv2.resize(flow, (w, h), interpolation=cv2.INTER_LINEAR) * np.array([w / size[0], h / size[1]], dtype=np.float32)
+    grid_x, grid_y = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+    warped = cv2.remap(src_mask.astype(np.float32), grid_x + flow[..., 0], grid_y + flow[..., 1],
+        interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    return warped > 0.5
+
+
+def ProposalFolder(save_folder):
+    # warped masks are kept apart from saved annotations
+    return joined(os.path.dirname(save_folder), 'proposed_masks')
+
+
+def NearestTick(ticks, tick, max_distance):
+    # position of the tick in ticks closest to tick, None if there is none within max_distance (ms)
+    if len(ticks) == 0:
+        return None
+    pos = int(np.argmin(np.abs(np.asarray(ticks) - tick)))
+    return pos if abs(int(ticks[pos]) - tick) <= max_distance else None
+
+
+def _capture(video_path, tick):
+    # decode the frame at tick, return BGR image or None
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_MSEC, tick)
+    ok, frame = cap.read()
+    cap.release()
+    return frame if ok else None
+
+
+def propagate_video(video_name, ticks=None):
+    '''Pre-propagate annotated masks of a video to ticks without annotation, return number of proposals.
+
+    ticks defaults to the annotated ticks in the csv and all captured frames. Missing frames are captured from the
+    video, each tick gets the warped mask of the nearest annotated tick. Ticks farther than max_tick_distance from
+    every annotated tick are skipped.
+    '''
+    conf = GBL_CONF['image_annotation']['propagation']
+    stem = str.split(video_name, '.')[0]
+    frames = FrameStore(joined('video_output', video_name, 'origin_imgs'), stem)
+    masks = MaskStore(joined('video_output', video_name, 'annotated_imgs'))
+    proposals = MaskStore(ProposalFolder(masks.folder))
+    annotated = np.array(sorted(TickOfName(n) for n in masks.names() if frames.has(n)), dtype=np.int64)
+    if len(annotated) == 0:
+        print(f'{video_name}: 没有已标注的帧, 跳过')
+        return 0
+    if ticks is None:
+        ticks = set(TickOfName(n) for n in frames.names())
+        csv_path = joined('video_annotation', stem + '.csv')
+        if os.path.exists(csv_path):
+            with open(csv_path, 'r', encoding='utf-8') as f:
+                ticks |= set(int(row['tick']) for row in csv.DictReader(f))
+    ticks = sorted(t for t in set(ticks) - set(annotated.tolist())
+        if NearestTick(annotated, t, conf['max_tick_distance']) is not None)
+    src_cache = {}
+    count = 0
+    for tick in ticks:
+        name = frames.name(tick)
+        if not frames.has(name):
+            frame = _capture(joined('video_input', video_name), tick)
+            if frame is None:
+                print(f'注意：无法截取{video_name}的{tick}ms')
+                continue
+            if GBL_CONF['video_annotation']['frame_store']['enable']:
+                frames.put(tick, GetCodec('frames').encode(frame))
+            else: # frame files of the old layout are always JPEG
+                ImageCodec('jpeg', 100).write(joined(frames.folder, name), frame)
+        src_tick = int(annotated[NearestTick(annotated, tick, conf['max_tick_distance'])])
+        if src_tick not in src_cache:
+            src_cache = {src_tick: (frames.read(frames.name(src_tick)), masks.get(frames.name(src_tick)))}
+        src_img, src_mask = src_cache[src_tick]
+        dst_img = frames.read(name)
+        if dst_img is None or dst_img.shape != src_img.shape:
+            continue
+        proposals.put(name, PropagateMask(src_img, src_mask, dst_img, conf['scale'], conf['tiles'], conf['workers']))
+        count += 1
+    print(f'{video_name}: 为{count}帧生成了标注建议')
+    return count
+
+
+def propagate_project(video_name=None, ticks=None):
+    if not video_name and not os.path.exists('video_output'):
+        print('注意：video_output不存在, 没有可以传播的标注')
+        return 0
+    video_names = [video_name] if video_name else sorted(p for p in os.listdir('video_output')
+        if os.path.exists(joined('video_output', p, 'annotated_imgs')))
+    return sum(propagate_video(v, ticks) for v in video_names)
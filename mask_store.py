@@ -0,0 +1,229 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+import numpy as np
+from file_lock import FileLock
+from image_codec import ReadImage
+
+INDEX_NAME = 'masks.json'
+STORE_VERSION = 1
+MASK_COLOR = (255, 0, 0) # annotated pixels are painted with pure blue (BGR)
+
+
+def GetAnnotatedMask(img):
+    # mask of a painted image, used for the legacy layout
+    return (img[:,:,0] > 240) * (img[:,:,1] < 10) * (img[:,:,2] < 10) # WH
+
+
+def PaintMask(img, mask, color=MASK_COLOR):
+    # painted image for display and export
+    img = img.copy()
+    img[mask, :] = color
+    return img
+
+
+class MaskStore():
+    '''Annotation masks of one folder, stored as bit-packed, zlib compressed records in a single data file.
+
+    masks.json maps image name to (offset, length, height, width, digest) in the data file. Saving a mask appends a
+    record under a file lock, and the data file is rewritten under a new name once most of it is stale, so readers in
+    other processes never see a half-written file. Painted JPEGs of the old layout are still readable until they are migrated.
+    '''
+    def __init__(self, folder) -> None:
+        self.folder = folder
+        self.index_path = os.path.join(folder, INDEX_NAME)
+        self.lock = threading.RLock()
+        self.stamp = None
+        self.data_name = None
+        self.masks = {} # name -> [offset, length, h, w, digest]
+        self.refresh()
+
+    def refresh(self):
+        # reload index if another process changed it
+        with self.lock:
+            try:
+                stat = os.stat(self.index_path)
+            except OSError:
+                self.stamp, self.data_name, self.masks = None, None, {}
+                return
+            stamp = (stat.st_size, stat.st_mtime_ns)
+            if stamp == self.stamp:
+                return
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as fp:
+                    index = json.load(fp)
+                if index.get('version') != STORE_VERSION:
+                    raise ValueError('unknown version')
+            except (OSError, ValueError) as e:
+                print(f'注意：{self.index_path}无法读取({e})')
+                return
+            self.stamp = stamp
+            self.data_name = index['data']
+            self.masks = index['masks']
+
+    def legacy_path(self, name):
+        return os.path.join(self.folder, name)
+
+    def names(self):
+        self.refresh()
+        with self.lock:
+            legacy = [e.name for e in os.scandir(self.folder) if e.name.endswith('.jpg')] if os.path.exists(self.folder) else []
+            return sorted(set(self.masks) | set(legacy))
+
+    def has(self, name):
+        self.refresh()
+        with self.lock:
+            return name in self.masks or os.path.exists(self.legacy_path(name))
+
+    def digest(self, name):
+        # identity of saved mask content, or None
+        self.refresh()
+        with self.lock:
+            if name in self.masks:
+                return self.masks[name][4]
+        if os.path.exists(self.legacy_path(name)):
+            stat = os.stat(self.legacy_path(name))
+            return f'legacy:{stat.st_size}:{stat.st_mtime_ns}'
+        return None
+
+    def get(self, name, retry=True):
+        # return bool mask (H, W), or None if not annotated
+        self.refresh()
+        with self.lock:
+            record = self.masks.get(name)
+            data_path = os.path.join(self.folder, self.data_name) if self.data_name else None
+        if record is not None:
+            offset, length, h, w, _ = record
+            try:
+                with open(data_path, 'rb') as fp:
+                    fp.seek(offset)
+                    packed = np.frombuffer(zlib.decompress(fp.read(length)), dtype=np.uint8)
+            except (OSError, zlib.error):
+                if not retry:
+                    raise
+                with self.lock: # compacted by another process in the meantime
+                    self.stamp = None
+                return self.get(name, retry=False)
+            return np.unpackbits(packed, count=h*w).reshape(h, w).astype(bool)
+        if os.path.exists(self.legacy_path(name)):
+            img = ReadImage(self.legacy_path(name))
+            if img is not None:
+                return GetAnnotatedMask(img)
+        return None
+
+    def put(self, name, mask):
+        h, w = mask.shape[:2]
+        payload = zlib.compress(np.packbits(mask.astype(bool)).tobytes())
+        os.makedirs(self.folder, exist_ok=True)
+        with self.lock, FileLock(self.index_path): # other annotators may append to the same store
+            self.stamp = None # reload, the index may have changed within the mtime resolution
+            self.refresh()
+            if self.data_name is None:
+                self.data_name = 'masks.0.dat'
+            data_path = os.path.join(self.folder, self.data_name)
+            with open(data_path, 'ab') as fp:
+                offset = fp.seek(0, os.SEEK_END)
+                fp.write(payload)
+            self.masks[name] = [offset, len(payload), h, w, hashlib.sha1(payload).hexdigest()]
+            self.save_index()
+            if os.path.exists(self.legacy_path(name)): # the store is the only copy from now on
+                os.remove(self.legacy_path(name))
+            self.compact()
+
+    def save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump({'version': STORE_VERSION, 'data': self.data_name, 'masks': self.masks}, fp)
+        os.replace(tmp_path, self.index_path)
+        stat = os.stat(self.index_path)
+        self.stamp = (stat.st_size, stat.st_mtime_ns)
+
+    def compact(self, force=False):
+        # rewrite data file without stale records once they take more than half of it
+        with self.lock:
+            data_path = os.path.join(self.folder, self.data_name)
+            live = sum(r[1] for r in self.masks.values())
+            total = os.path.getsize(data_path)
+            if not force and (total - live < (1 << 20) or total - live < live):
+                return
+            generation = int(self.data_name.split('.')[1]) + 1
+            new_name = f'masks.{generation}.dat'
+            new_masks = {}
+            with open(data_path, 'rb') as src, open(os.path.join(self.folder, new_name), 'wb') as dst:
+                for name, (offset, length, h, w, digest) in sorted(self.masks.items(), key=lambda x: x[1][0]):
+                    src.seek(offset)
+                    new_masks[name] = [dst.tell(), length, h, w, digest]
+                    dst.write(src.read(length))
+            self.data_name, self.masks = new_name, new_masks
+            self.save_index()
+            for p in os.listdir(self.folder):
+                if p.startswith('masks.') and p.endswith('.dat') and p != new_name:
+                    try:
+                        os.remove(os.path.join(self.folder, p))
+                    except OSError:
+                        pass # still opened by a reader on Windows, removed by the next compaction
+
+    def migrate(self):
+        # convert painted JPEGs of the old layout, return number of converted images
+        count = 0
+        for name in self.names():
+            with self.lock:
+                if name in self.masks:
+                    continue
+            mask = self.get(name)
+            if mask is not None:
+                self.put(name, mask)
+                count += 1
+        return count
+
+
+def migrate_masks():
+    '''Convert all annotated_imgs folders of the old layout to mask stores
+    '''
+    folders = ['annotated_imgs'] if os.path.exists('annotated_imgs') else []
+    if os.path.exists('video_output'):
+        folders += [os.path.join('video_output', p, 'annotated_imgs') for p in sorted(os.listdir('video_output'))
+            if os.path.exists(os.path.join('video_output', p, 'annotated_imgs'))]
+    total = 0
+    for folder in folders:
+        count = MaskStore(folder).migrate()
+        if count > 0:
+            print(f'{folder}: 转换了{count}张标注图')
+        total += count
+    print(f'共转换了{total}张标注图')
+    return total
+
+
+def export_masks(output_name='painted_imgs'):
+    '''Render the saved masks of all annotated_imgs folders onto their original images, written to a painted_imgs
+    folder next to each annotated_imgs folder in the export codec
+    '''
+    from frame_store import FrameStore
+    from image_codec import GetCodec
+    codec = GetCodec('export')
+    folders = [('', None)] if os.path.exists('annotated_imgs') else [] # image mode
+    if os.path.exists('video_output'):
+        folders += [(os.path.join('video_output', p), str.split(p, '.')[0]) for p in sorted(os.listdir('video_output'))
+            if os.path.exists(os.path.join('video_output', p, 'annotated_imgs'))]
+    total = 0
+    for root, stem in folders:
+        masks = MaskStore(os.path.join(root, 'annotated_imgs'))
+        frames = FrameStore(os.path.join(root, 'origin_imgs'), stem) if stem is not None else None
+        out_folder = os.path.join(root, output_name)
+        os.makedirs(out_folder, exist_ok=True)
+        count = 0
+        for name in masks.names():
+            img = frames.read(name) if frames is not None else ReadImage(os.path.join(root, 'origin_imgs', name))
+            mask = masks.get(name)
+            if img is None or mask is None or mask.shape != img.shape[:2]:
+                print(f'注意：{os.path.join(root, "origin_imgs", name)}不存在或与标注大小不一致')
+                continue
+            codec.write(os.path.join(out_folder, os.path.splitext(name)[0] + codec.ext), PaintMask(img, mask))
+            count += 1
+        if count > 0:
+            print(f'{out_folder}: 导出了{count}张标注图')
+        total += count
+    print(f'共导出了{total}张标注图')
+    return total
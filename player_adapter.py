@@ -0,0 +1,129 @@
+import threading
+from types import SimpleNamespace
+
+
+class PlayerAdapter():
+    '''Subscribe to libvlc events and forward changes to the UI thread.
+
+    libvlc calls back from its own thread. Updates are coalesced: at most one call is queued to the UI thread per kind,
+    and a callback only runs when the value really changed, so a paused player causes no wakeups at all.
+    '''
+    def __init__(self, player, post, on_time=None, on_length=None, on_end=None, event_type=None) -> None:
+        if event_type is None:
+            import vlc
+            event_type = vlc.EventType
+        self.player = player
+        self.post = post # run a function on the UI thread, e.g. wx.CallAfter
+        self.on_time = on_time
+        self.on_length = on_length
+        self.on_end = on_end
+        self.lock = threading.Lock()
+        self.latest = {'time': None, 'length': None}
+        self.delivered = {'time': None, 'length': None}
+        self.posted = {'time': False, 'length': False}
+        self.em = player.event_manager()
+        self.em.event_attach(event_type.MediaPlayerTimeChanged, lambda evt: self._changed('time', evt.u.new_time))
+        self.em.event_attach(event_type.MediaPlayerLengthChanged, lambda evt: self._changed('length', evt.u.new_length))
+        self.em.event_attach(event_type.MediaPlayerEndReached, lambda evt: self.post(self._deliver_end))
+
+    def _changed(self, kind, value):
+        # libvlc thread
+        with self.lock:
+            self.latest[kind] = value
+            if self.posted[kind] or value == self.delivered[kind]:
+                return
+            self.posted[kind] = True
+        self.post(self._deliver, kind)
+
+    def _deliver(self, kind):
+        # UI thread
+        with self.lock:
+            value = self.latest[kind]
+            self.posted[kind] = False
+            if value == self.delivered[kind]:
+                return
+            self.delivered[kind] = value
+        callback = self.on_time if kind == 'time' else self.on_length
+        if callback is not None:
+            callback(value)
+
+    def _deliver_end(self):
+        with self.lock:
+            self.delivered['time'] = None # replaying from start should be reported again
+        if self.on_end is not None:
+            self.on_end()
+
+
+class FakeEventManager():
+    def __init__(self) -> None:
+        self.callbacks = {}
+
+    def event_attach(self, event_type, callback):
+        self.callbacks.setdefault(event_type, []).append(callback)
+
+    def emit(self, event_type, **kwargs):
+        evt = SimpleNamespace(type=event_type, u=SimpleNamespace(**kwargs))
+        for callback in self.callbacks.get(event_type, []):
+            callback(evt)
+
+
+class FakePlayer():
+    '''Stand-in for vlc.MediaPlayer, used to run the timing logic headlessly.
+
+    Time only moves when advance() is called. A seek lands after seek_delay_ms of advanced time, like a real decoder.
+    '''
+    EventType = SimpleNamespace(MediaPlayerTimeChanged='time', MediaPlayerLengthChanged='length', MediaPlayerEndReached='end')
+
+    def __init__(self, length=60*1000, seek_delay_ms=0) -> None:
+        self.length = length
+        self.seek_delay_ms = seek_delay_ms
+        self.time = 0
+        self.playing = False
+        self.seek_target = None # (tick, remaining delay)
+        self.em = FakeEventManager()
+
+    def event_manager(self):
+        return self.em
+
+    def get_time(self):
+        return self.time
+
+    def get_length(self):
+        return self.length
+
+    def is_playing(self):
+        return self.playing
+
+    def play(self):
+        if not self.playing:
+            self.em.emit(self.EventType.MediaPlayerLengthChanged, new_length=self.length)
+        self.playing = True
+        return 0
+
+    def set_pause(self, flag):
+        self.playing = not flag
+
+    def set_time(self, tick):
+        self.seek_target = (tick, self.seek_delay_ms)
+        if self.seek_delay_ms <= 0:
+            self.advance(0)
+
+    def advance(self, ms):
+        if self.seek_target is not None:
+            tick, remaining = self.seek_target
+            if remaining - ms <= 0:
+                self.seek_target = None
+                self._set(tick)
+            else:
+                self.seek_target = (tick, remaining - ms)
+        if self.playing and ms > 0:
+            self._set(min(self.length, self.time + ms))
+            if self.time >= self.length:
+                self.playing = False
+                self.em.emit(self.EventType.MediaPlayerEndReached)
+
+    def _set(self, tick):
+        if tick != self.time:
+            self.time = tick
+            self.em.emit(self.EventType.MediaPlayerTimeChanged, new_time=tick)
+
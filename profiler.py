@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+from functools import wraps
+from configs import GBL_CONF
+
+
+class Profiler():
+    '''Opt-in span recorder for UI handlers, enabled by env ANNO_PROFILE=1 or profile.enable in configs.yml.
+
+    Spans are kept in a ring buffer and written as Chrome trace JSON (open in chrome://tracing or Perfetto) with a
+    percentile summary when the process exits. When disabled, profiled() returns the function unchanged.
+    '''
+    def __init__(self) -> None:
+        conf = GBL_CONF['profile']
+        self.enabled = os.environ.get('ANNO_PROFILE', '') not in ['', '0'] or conf['enable']
+        self.output_dir = conf['output_dir']
+        self.spans = deque(maxlen=conf['buffer_size']) # (name, start_ns, duration_ns, thread id)
+        self.origin_ns = time.perf_counter_ns()
+        self.dumped = False
+        if self.enabled:
+            atexit.register(self.dump)
+
+    def record(self, name, start_ns, end_ns):
+        self.spans.append((name, start_ns, end_ns - start_ns, threading.get_ident()))
+
+    def summary(self):
+        # percentiles (ms) of each span name
+        import numpy as np
+        durations = {}
+        for name, _, dur, _ in list(self.spans):
+            durations.setdefault(name, []).append(dur)
+        result = {}
+        for name, durs in sorted(durations.items()):
+            d = np.asarray(durs) / 1e6
+            result[name] = {
+                'count': len(d),
+                'p50': round(float(np.percentile(d, 50)), 3),
+                'p95': round(float(np.percentile(d, 95)), 3),
+                'p99': round(float(np.percentile(d, 99)), 3),
+                'max': round(float(d.max()), 3),
+            }
+        return result
+
+    def dump(self):
+        if not self.enabled or self.dumped or len(self.spans) == 0:
+            return
+        self.dumped = True
+        pid = os.getpid()
+        events = [{'name': name, 'ph': 'X', 'ts': (start - self.origin_ns) / 1e3, 'dur': dur / 1e3, 'pid': pid, 'tid': tid}
+            for name, start, dur, tid in list(self.spans)]
+        summary = self.summary()
+        os.makedirs(self.output_dir, exist_ok=True)
+        out_path = os.path.join(self.output_dir, time.strftime('trace_%Y%m%d_%H%M%S') + f'_{pid}.json')
+        with open(out_path, 'w', encoding='utf-8') as fp:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'summary': summary}}, fp)
+        print(f'性能记录已保存到{out_path}')
+        print(f'{"span":<40}{"count":>8}{"p50(ms)":>10}{"p95(ms)":>10}{"p99(ms)":>10}{"max(ms)":>10}')
+        for name, s in summary.items():
+            print(f'{name:<40}{s["count"]:>8}{s["p50"]:>10}{s["p95"]:>10}{s["p99"]:>10}{s["max"]:>10}')
+
+
+PROFILER = Profiler()
+
+
+def profiled(name=None):
+    '''Decorator recording the duration of each call. Returns the function itself when profiling is off.
+    '''
+    def decorator(func):
+        if not PROFILER.enabled:
+            return func
+        span_name = name or func.__qualname__
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                PROFILER.record(span_name, start, time.perf_counter_ns())
+        return wrapper
+    return decorator
@@ -0,0 +1,68 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ProxyBuilder():
+    '''Transcode small all-intra proxies of videos with ffmpeg in background.
+
+    Every frame of a proxy is a keyframe, so seeking in a proxy only decodes one small frame. Proxies are used for
+    seeking and scrubbing only, snapshots are always taken from the original video.
+    '''
+    def __init__(self, cache, height=360, crf=28, workers=1) -> None:
+        self.cache = cache # proxies are stored in ArtefactCache, keyed by the source video
+        self.height = height
+        self.crf = crf
+        self.ffmpeg = shutil.which('ffmpeg')
+        self.executor = ThreadPoolExecutor(max_workers=workers) # ffmpeg runs in subprocess
+        self.futures = {}
+        self.procs = set() # running ffmpeg processes
+        if self.ffmpeg is None:
+            print('注意：没有找到ffmpeg, 不生成代理视频')
+
+    def key(self, video_path):
+        return self.cache.key(video_path, 'proxy', f'{self.height}-{self.crf}')
+
+    def is_ready(self, video_path):
+        return self.cache.get('proxy', self.key(video_path)) is not None
+
+    def submit(self, video_path):
+        if self.ffmpeg is None or video_path in self.futures:
+            return
+        self.futures[video_path] = self.executor.submit(self._transcode, video_path)
+
+    def get(self, video_path):
+        # return path of a finished proxy, or None
+        future = self.futures.get(video_path)
+        if future is not None and not future.done():
+            return None
+        return self.cache.get('proxy', self.key(video_path))
+
+    def _transcode(self, video_path):
+        if self.is_ready(video_path):
+            return
+        key = self.key(video_path)
+        out_path = self.cache.path('proxy', key, '.mp4')
+        tmp_path = out_path + '.tmp.mp4'
+        cmd = [self.ffmpeg, '-y', '-v', 'error', '-i', video_path, '-an',
+            '-vf', f'scale=-2:{self.height}', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(self.crf),
+            '-g', '1', '-keyint_min', '1', '-pix_fmt', 'yuv420p', tmp_path] # -g 1: all-intra
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        self.procs.add(proc)
+        _, stderr = proc.communicate()
+        self.procs.discard(proc)
+        if proc.returncode != 0:
+            print(f'注意：生成{video_path}的代理视频失败: {stderr.strip()}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        os.replace(tmp_path, out_path)
+        self.cache.commit('proxy', key, out_path)
+        print(f'已生成代理视频{out_path}')
+
+    def shutdown(self):
+        # stop running ffmpeg, the temporary output is overwritten next time
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for proc in list(self.procs):
+            proc.terminate()
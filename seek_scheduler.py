@@ -0,0 +1,87 @@
+import time
+from collections import deque
+import numpy as np
+
+
+class SeekScheduler():
+    '''All player seeks go through this scheduler.
+
+    Only the latest request is kept, superseded requests are dropped. A new seek is issued only after the player reports
+    that the previous one has landed (or timed out), and the latency of every seek is recorded.
+    '''
+    def __init__(self, player, tolerance_ms=40, timeout_ms=1000, history=1024) -> None:
+        self.player = player
+        self.tolerance_ms = tolerance_ms
+        self.timeout_ms = timeout_ms
+        self.pending = None # latest requested tick
+        self.inflight = None # (tick, issued time)
+        self.waiters = [] # callbacks run by pump once all seeks landed
+        self.latencies = deque(maxlen=history) # ms, time to the first correct frame
+        self.dropped = 0
+        self.timeouts = 0
+
+    def request(self, tick):
+        tick = int(tick)
+        if self.pending is not None and self.pending != tick:
+            self.dropped += 1
+        self.pending = tick
+        self.pump()
+
+    def reset(self):
+        # drop all requests and waiters, e.g. when the player is stopped
+        self.pending = None
+        self.inflight = None
+        self.waiters = []
+
+    def expect(self, tick):
+        # the player is moved to tick by other ways (e.g. reloading media), wait for it as a seek
+        self.inflight = (int(tick), time.perf_counter())
+
+    def busy(self):
+        return self.inflight is not None or self.pending is not None
+
+    def target(self):
+        # the tick which the player will show after all seeks landed
+        if self.pending is not None:
+            return self.pending
+        if self.inflight is not None:
+            return self.inflight[0]
+        return self.player.get_time()
+
+    def pump(self):
+        # called by a timer or player events, return True if idle
+        now = time.perf_counter()
+        if self.inflight is not None:
+            tick, issued = self.inflight
+            elapsed = (now - issued) * 1000
+            if abs(self.player.get_time() - tick) <= self.tolerance_ms:
+                self.latencies.append(elapsed)
+            elif elapsed > self.timeout_ms:
+                self.timeouts += 1
+                self.latencies.append(elapsed)
+            else:
+                return False
+            self.inflight = None
+        if self.pending is not None:
+            tick, self.pending = self.pending, None
+            if abs(self.player.get_time() - tick) > self.tolerance_ms:
+                self.player.set_time(tick)
+                self.inflight = (tick, now)
+        idle = not self.busy()
+        if idle and len(self.waiters) > 0:
+            waiters, self.waiters = self.waiters, []
+            for callback in waiters:
+                callback()
+        return idle
+
+    def when_landed(self, callback):
+        # run callback from pump once the latest request landed (or timed out), at once if idle; return True if it ran
+        self.waiters.append(callback)
+        return self.pump()
+
+    def summary(self):
+        if len(self.latencies) == 0:
+            return 'seek: no seek recorded'
+        lat = np.array(self.latencies)
+        return 'seek: n=%d p50=%.1fms p95=%.1fms max=%.1fms dropped=%d timeouts=%d' % (
+            len(lat), np.percentile(lat, 50), np.percentile(lat, 95), lat.max(), self.dropped, self.timeouts)
@@ -0,0 +1,102 @@
+import zlib
+import cv2
+import numpy as np
+
+STAMP_DTYPE = np.dtype([('x', '<i2'), ('y', '<i2'), ('size', '<i2'), ('scale', '<f2')]) # 8 bytes per brush stamp
+
+
+class StrokeJournal():
+    '''Undo/redo history of the strokes painted on one image.
+
+    A step is either a brush stroke, kept as its stamps (centre, brush size and view scale), or an assisted fill, kept as
+    its ROI and bit-packed region. Every checkpoint_every steps the painted mask is saved compressed, undo and redo
+    paint the nearest checkpoint onto the base image and replay at most checkpoint_every - 1 steps from there.
+    '''
+    def __init__(self, base_img, color, checkpoint_every=16, max_steps=200) -> None:
+        self.base_img = base_img.copy() # image before the first step
+        self.color = color
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.max_steps = max(self.checkpoint_every, max_steps)
+        self.steps = []
+        self.applied = 0 # steps[:applied] are painted, the rest can be redone
+        self.checkpoints = {} # number of applied steps -> compressed packed mask
+        self.mask = np.zeros(base_img.shape[:2], np.uint8) # painted pixels after all applied steps
+        self.stamps = [] # stamps of the stroke being drawn
+
+    def add_stamp(self, x, y, size, scale):
+        self.stamps.append((x, y, size, scale))
+
+    def end_stroke(self):
+        if len(self.stamps) > 0:
+            self.record(('stroke', np.array(self.stamps, dtype=STAMP_DTYPE)))
+            self.stamps = []
+
+    def add_fill(self, roi, region):
+        self.record(('fill', roi, zlib.compress(np.packbits(region).tobytes())))
+
+    def record(self, step):
+        # new step, steps which were undone can not be redone any more
+        del self.steps[self.applied:]
+        for n in [n for n in self.checkpoints if n > self.applied]:
+            del self.checkpoints[n]
+        self.steps.append(step)
+        self.paint(self.mask, step)
+        self.applied += 1
+        if self.applied % self.checkpoint_every == 0:
+            self.checkpoints[self.applied] = zlib.compress(np.packbits(self.mask).tobytes())
+        if self.applied > self.max_steps:
+            self.fold()
+
+    def fold(self):
+        # merge the oldest checkpoint into the base image, its steps can not be undone any more
+        n = min(self.checkpoints)
+        self.base_img = self.render_mask(self.base_img, self.load_checkpoint(n))
+        self.steps = self.steps[n:]
+        self.applied -= n
+        self.checkpoints = {k - n: v for k, v in self.checkpoints.items() if k > n}
+
+    def paint(self, mask, step):
+        if step[0] == 'stroke':
+            for x, y, size, _ in step[1].tolist():
+                cv2.circle(mask, (x, y), size, 1, -1)
+        else:
+            (x1, y1, x2, y2), packed = step[1], step[2]
+            region = np.unpackbits(np.frombuffer(zlib.decompress(packed), np.uint8), count=(y2-y1)*(x2-x1))
+            mask[y1:y2, x1:x2][region.reshape(y2-y1, x2-x1) > 0] = 1
+
+    def load_checkpoint(self, n):
+        if n == 0:
+            return np.zeros(self.mask.shape, np.uint8)
+        h, w = self.mask.shape
+        return np.unpackbits(np.frombuffer(zlib.decompress(self.checkpoints[n]), np.uint8), count=h*w).reshape(h, w)
+
+    def render_mask(self, img, mask):
+        img = img.copy()
+        img[mask > 0] = self.color
+        return img
+
+    def seek(self, applied):
+        # rebuild the mask after the first applied steps, return the painted image
+        n = max([k for k in self.checkpoints if k <= applied], default=0)
+        mask = self.load_checkpoint(n)
+        for step in self.steps[n:applied]:
+            self.paint(mask, step)
+        self.mask, self.applied = mask, applied
+        return self.render_mask(self.base_img, mask)
+
+    def can_undo(self):
+        return self.applied > 0
+
+    def can_redo(self):
+        return self.applied < len(self.steps)
+
+    def undo(self):
+        return self.seek(self.applied - 1)
+
+    def redo(self):
+        return self.seek(self.applied + 1)
+
+    def nbytes(self):
+        # memory taken by the history, without the base image and the working mask
+        size = sum(s[1].nbytes if s[0] == 'stroke' else len(s[2]) + 16 for s in self.steps)
+        return size + sum(len(c) for c in self.checkpoints.values())
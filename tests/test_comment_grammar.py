@@ -0,0 +1,48 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comment_grammar import CommentGrammar, changed_spans, SPAN_SAMPLE
+
+GRAMMAR = CommentGrammar(['OK', 'HARD', 'QUEST'], ['P1', 'P2'])
+
+
+def styles(text):
+    # kind of every character after a full restyle
+    result = [None] * len(text)
+    for s, e, kind in GRAMMAR.tokenize(text):
+        result[s:e] = [kind] * (e - s)
+    return result
+
+
+def restyle(old, start, end, inserted, cursor):
+    # styles in the text control after replacing old[start:end] by inserted and restyling the changed spans, inserted
+    # characters take the style of the character before them as in wx.TextCtrl
+    new = old[:start] + inserted + old[end:]
+    buf = styles(old)
+    buf = buf[:start] + [buf[start - 1] if start > 0 else None] * len(inserted) + buf[end:]
+    for s, e, kind in changed_spans(old, GRAMMAR.tokenize(old), new, GRAMMAR.tokenize(new), cursor):
+        buf[s:e] = [kind] * (e - s)
+    return new, buf
+
+
+def test_ambiguous_delete_is_restyled():
+    # deleting 'K O' from 'm,1@OK OK' leaves the last K with the style of ' OK'
+    old = 'm,1@OK OK'
+    new = 'm,1@OK'
+    assert (2, 6, SPAN_SAMPLE) in changed_spans(old, GRAMMAR.tokenize(old), new, GRAMMAR.tokenize(new))
+    new, buf = restyle(old, 5, 8, '', cursor=5)
+    assert buf == styles(new)
+
+
+def test_random_edits_with_cursor():
+    rng = random.Random(0)
+    pieces = ['1@OK', 'OK', ' ', ',', 'm', '2@HARD', 'frm@P1', 'K', 'O', '@', '1', 'P1', ',HARD']
+    for _ in range(5000):
+        old = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 6)))
+        start = rng.randint(0, len(old))
+        end = rng.randint(start, len(old))
+        inserted = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 2)))
+        new, buf = restyle(old, start, end, inserted, cursor=start + len(inserted))
+        assert buf == styles(new), (old, new)
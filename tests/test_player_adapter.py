@@ -0,0 +1,74 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from player_adapter import PlayerAdapter, FakePlayer
+from seek_scheduler import SeekScheduler
+
+
+class Harness():
+    # fake player, adapter posting to a queue drained by run_ui(), and the UI wakeups per kind
+    def __init__(self, length=10*1000, seek_delay_ms=30) -> None:
+        self.queue = []
+        self.wakeups = {'time': 0, 'length': 0, 'end': 0}
+        self.player = FakePlayer(length=length, seek_delay_ms=seek_delay_ms)
+        self.seeker = SeekScheduler(self.player, tolerance_ms=1)
+        self.adapter = PlayerAdapter(self.player, lambda fn, *args: self.queue.append((fn, args)),
+            on_time=self.on_time, on_length=lambda l: self.count('length'), on_end=lambda: self.count('end'),
+            event_type=FakePlayer.EventType)
+
+    def count(self, kind):
+        self.wakeups[kind] += 1
+
+    def on_time(self, t):
+        self.count('time')
+        self.seeker.pump()
+
+    def run_ui(self):
+        while self.queue:
+            fn, args = self.queue.pop(0)
+            fn(*args)
+
+
+def test_paused_player_causes_no_time_callbacks():
+    h = Harness()
+    h.player.play()
+    for i in range(100):
+        h.player.advance(10)
+        if i % 10 == 0:
+            h.run_ui()
+    h.run_ui()
+    assert 0 < h.wakeups['time'] <= 11 # coalesced, at most one per UI run
+    h.player.set_pause(1)
+    before = h.wakeups['time']
+    for _ in range(100):
+        h.player.advance(10)
+        h.run_ui()
+    assert h.wakeups['time'] == before
+
+
+def test_length_and_end_are_reported_once():
+    h = Harness(length=1000)
+    h.player.play()
+    for _ in range(200):
+        h.player.advance(10)
+    h.run_ui()
+    assert h.wakeups['length'] <= 1
+    assert h.wakeups['end'] <= 1
+    assert h.player.get_time() == 1000
+
+
+def test_seeker_lands_on_last_request():
+    h = Harness()
+    for tick in range(2000, 3000, 50):
+        h.seeker.request(tick)
+        h.player.advance(10)
+        h.run_ui()
+    for _ in range(1000):
+        if h.seeker.pump():
+            break
+        h.player.advance(10)
+        h.run_ui()
+    assert not h.seeker.busy()
+    assert h.player.get_time() == 2950
+    assert h.seeker.dropped > 0
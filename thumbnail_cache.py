@@ -0,0 +1,184 @@
+import os
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+# (ms per thumbnail, name), the first level is decoded from video, the others are sampled from it
+THUMB_LEVELS = [(1000, 'sec'), (60*1000, 'min')]
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool(workers):
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=workers)
+        return _POOL
+
+
+def shutdown_pool():
+    # drop queued chunks on exit, unfinished atlases are regenerated next time
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = None
+
+
+def _build_chunk(video_path, atlas_path, valid_path, level_ms, start, end, size):
+    '''Decode thumbnails [start, end) of the finest level, executed in worker process
+    '''
+    cap = cv2.VideoCapture(video_path)
+    atlas = np.load(atlas_path, mmap_mode='r+')
+    valid = np.load(valid_path, mmap_mode='r+')
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    half_frame = 500.0 / fps if fps and fps > 0 else 1000.0 / 60.0
+    cap.set(cv2.CAP_PROP_POS_MSEC, start * level_ms)
+    idx = start
+    while idx < end:
+        if not cap.grab(): # grab without decoding to BGR is much faster than read
+            break
+        pos = cap.get(cv2.CAP_PROP_POS_MSEC)
+        if pos + half_frame < idx * level_ms:
+            continue
+        ret, frame = cap.retrieve()
+        if not ret:
+            break
+        thumb = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+        while idx < end and idx * level_ms <= pos + half_frame:
+            atlas[idx] = thumb
+            valid[idx] = 1
+            idx += 1
+    atlas.flush()
+    valid.flush()
+    cap.release()
+    return end - start
+
+
+class ThumbnailAtlas():
+    '''Memory-mapped thumbnails of a video, one per second and coarser levels for the minute tiles.
+
+    Thumbnails are generated in background by a process pool, the Selector reads them directly without decoding.
+    '''
+    def __init__(self, video_path, cache_dir, size=(64, 36), workers=4, chunk_seconds=120, on_complete=None) -> None:
+        self.video_path = video_path
+        self.on_complete = on_complete
+        self.size = (int(size[0]), int(size[1])) # w, h
+        os.makedirs(cache_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(video_path))[0]
+        self.prefix = os.path.join(cache_dir, stem + '@thumbs')
+        self.meta_path = self.prefix + '.json'
+        self.atlas = {} # level_ms -> memmap
+        self.valid = {} # level_ms -> memmap
+        self.lock = threading.Lock()
+        self.remaining = 0
+        self.failed = False # a chunk raised, the atlas is rebuilt next session
+        stat = os.stat(video_path)
+        self.meta = {'video_size': stat.st_size, 'video_mtime': stat.st_mtime, 'width': self.size[0], 'height': self.size[1]}
+        if self.load_meta():
+            self.open_levels()
+            return
+        cap = cv2.VideoCapture(video_path)
+        fps, frame_count = cap.get(cv2.CAP_PROP_FPS), cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        cap.release()
+        duration_ms = 1000.0 * frame_count / fps if fps and fps > 0 else 0
+        if duration_ms <= 0:
+            print(f'注意：无法读取{video_path}的时长, 不生成缩略图')
+            return
+        self.meta['duration_ms'] = duration_ms
+        self.meta['complete'] = False
+        for level_ms, name in THUMB_LEVELS:
+            count = int(duration_ms // level_ms) + 1
+            np.lib.format.open_memmap(self.level_path(name), mode='w+', dtype=np.uint8, shape=(count, self.size[1], self.size[0], 3))
+            np.lib.format.open_memmap(self.valid_path(name), mode='w+', dtype=np.uint8, shape=(count,))
+        self.open_levels()
+        # split the finest level into chunks, each worker seeks once and decodes sequentially
+        level_ms, name = THUMB_LEVELS[0]
+        count = len(self.valid[level_ms])
+        chunk = max(1, int(chunk_seconds * 1000 // level_ms))
+        pool = get_pool(workers)
+        self.remaining = (count + chunk - 1) // chunk
+        for start in range(0, count, chunk):
+            future = pool.submit(_build_chunk, video_path, self.level_path(name), self.valid_path(name),
+                level_ms, start, min(start + chunk, count), self.size)
+            future.add_done_callback(self.on_chunk_done)
+
+    def level_path(self, name):
+        return self.prefix + '_' + name + '.npy'
+
+    def valid_path(self, name):
+        return self.prefix + '_' + name + '_valid.npy'
+
+    def load_meta(self):
+        if not os.path.exists(self.meta_path):
+            return False
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as fp:
+                meta = json.load(fp)
+        except (OSError, ValueError):
+            return False
+        for key in ['video_size', 'video_mtime', 'width', 'height']:
+            if meta.get(key) != self.meta[key]:
+                return False
+        if not meta.get('complete'):
+            return False
+        self.meta = meta
+        return True
+
+    def open_levels(self):
+        for level_ms, name in THUMB_LEVELS:
+            self.atlas[level_ms] = np.load(self.level_path(name), mmap_mode='r')
+            self.valid[level_ms] = np.load(self.valid_path(name), mmap_mode='r')
+
+    def on_chunk_done(self, future):
+        if future.cancelled(): # pool was shut down, the atlas stays incomplete and is rebuilt next time
+            return
+        error = future.exception()
+        if error is not None:
+            print(f'注意：生成{self.video_path}的缩略图时出现错误: {error}')
+        with self.lock:
+            self.failed |= error is not None
+            self.remaining -= 1
+            if self.remaining > 0:
+                return
+        # all chunks are done, sample coarser levels from the finest level
+        base_ms, base_name = THUMB_LEVELS[0]
+        base = np.load(self.level_path(base_name), mmap_mode='r')
+        base_valid = np.load(self.valid_path(base_name), mmap_mode='r')
+        for level_ms, name in THUMB_LEVELS[1:]:
+            atlas = np.load(self.level_path(name), mmap_mode='r+')
+            valid = np.load(self.valid_path(name), mmap_mode='r+')
+            src = np.minimum(np.arange(len(valid)) * (level_ms // base_ms), len(base_valid) - 1)
+            atlas[:] = base[src]
+            valid[:] = base_valid[src]
+            atlas.flush()
+            valid.flush()
+        if self.failed: # thumbnails generated so far are used in this session only
+            return
+        self.meta['complete'] = True
+        with open(self.meta_path, 'w', encoding='utf-8') as fp:
+            json.dump(self.meta, fp)
+        if self.on_complete is not None:
+            self.on_complete()
+
+    def locate(self, tick, interval_ms=0):
+        # return (level_ms, index) of thumbnail at tick, using the coarsest level finer than interval_ms; None if not generated yet
+        if len(self.atlas) == 0 or tick < 0:
+            return None
+        levels = [lm for lm, _ in THUMB_LEVELS if lm <= interval_ms] or [THUMB_LEVELS[0][0]]
+        for level_ms in reversed(levels): # coarser levels are ready only after the finest level is done
+            idx = int(tick // level_ms)
+            valid = self.valid[level_ms]
+            if idx < len(valid) and valid[idx]:
+                return level_ms, idx
+        return None
+
+    def get(self, tick, interval_ms=0):
+        # return RGB thumbnail at tick, None if not generated yet
+        loc = self.locate(tick, interval_ms)
+        if loc is None:
+            return None
+        return self.atlas[loc[0]][loc[1]]
@@ -42,16 +42,36 @@ import subprocess
 import os
 from os.path import basename, exists, join as joined
 import sys
+import threading
+import time
 from configs import GBL_CONF, isWin, isMacOS
 import numpy as np
-import re, csv
-from image_annotation import ImageAnnotator, GetCommentImg
+import cv2
+import csv
+from image_annotation import GetCommentImg
+from frame_buffer import FrameRingBuffer
+from seek_scheduler import SeekScheduler
+from thumbnail_cache import ThumbnailAtlas, shutdown_pool
+from video_probe import ManifestPool
+from proxy_transcode import ProxyBuilder
+from artefact_cache import ArtefactCache
+from player_adapter import PlayerAdapter
+from annotator_process import AnnotatorProcess
+from comment_grammar import CommentGrammar, changed_spans, SPAN_SAMPLE, SPAN_FRAME, SPAN_TEXT
+from profiler import profiled
+from mask_store import MaskStore, PaintMask
+from frame_store import FrameStore
+from frame_hash import DuplicateGroups
+from video_summary import SummaryPool
+from file_lock import FileLock
+from image_codec import GetCodec, DecodeImage, SniffFormat, RENDER_FORMATS
+from annotation_merge import RowValues, ReadAnnotations, WriteAnnotations, MergeAnnotations, WriteConflicts, ROW_FIELDS
 
 if isWin:
-    import win32file
     def is_occupied(file_name):
         if not exists(file_name):
             return False
+        import win32file # only needed when saving, pywin32 is slow to import
         try:
             vHandle = win32file.CreateFile(file_name, win32file.GENERIC_READ, 0, None, win32file.OPEN_EXISTING, win32file.      FILE_ATTRIBUTE_NORMAL, None)
             return int(vHandle) == win32file.INVALID_HANDLE_VALUE
@@ -72,6 +92,7 @@ class AnnotationData():
     
     def clear(self):
         self.load_path = None
+        self.base = {} # annotations as last read from or written to csv, see save_data
         self.data = {}
         self.sorted_keys = []
         self._dirty = False
@@ -83,24 +104,7 @@ class AnnotationData():
             print('No csv file loaded')
     
     def load_data(self, csv_path):
-        self.load_path = csv_path
-        self.data = {}
-        videoname = os.path.split(csv_path)[-1][:-4] + '.mp4'
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                self.data[int(row['tick'])] = {
-                    'type': row['type'],
-                    'videoname': videoname,
-                    'img_name': row['img_name'],
-                    'region_count': row['region_count'],
-                    'sample_attr': row['sample_attr'],
-                    'frame_attr': row['frame_attr'],
-                    'comment': row['comment'],
-                    'anchors': row['anchors']
-                }
-        self.sorted_keys = sorted(list(self.data.keys()))
-        self._dirty = False
+        self.set_rows(csv_path, ReadAnnotations(csv_path))
     
     def save_data(self, csv_path):
         videoname = os.path.split(csv_path)[-1][:-4] + '.mp4'
@@ -109,22 +113,35 @@ class AnnotationData():
             dlg = wx.MessageDialog(None, f'{csv_path}被另一个程序打开, 无法保存', 'Error', wx.OK | wx.ICON_ERROR)
             dlg.ShowModal()
             return
-        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['tick', 'type', 'videoname', 'img_name', 'region_count', 'sample_attr', 'frame_attr', 'comment', 'anchors'])
-            for tick in sorted(self.data.keys()):
-                writer.writerow([
-                    tick, 
-                    self.data[tick]['type'], 
-                    videoname, 
-                    self.data[tick]['img_name'] if self.data[tick].get('img_name') else '',
-                    self.data[tick]['region_count'] if self.data[tick].get('region_count') else '', 
-                    self.data[tick]['sample_attr'] if self.data[tick].get('sample_attr') else '', 
-                    self.data[tick]['frame_attr'] if self.data[tick].get('frame_attr') else '',
-                    self.data[tick]['comment'] if self.data[tick].get('comment') else '',
-                    self.data[tick]['anchors'] if self.data[tick].get('anchors') else ''
-                ])
-        
+        # other annotators may have saved the same csv since it was loaded, merge instead of overwriting
+        base = self.base if self.load_path == csv_path else {}
+        try:
+            with FileLock(csv_path, GBL_CONF['video_annotation']['lock']['timeout_s']):
+                merged, conflicts = MergeAnnotations(base, {t: RowValues(r) for t, r in self.data.items()}, ReadAnnotations(csv_path))
+                WriteAnnotations(csv_path, merged, videoname)
+                conflict_path = WriteConflicts(csv_path, conflicts, videoname) if len(conflicts) > 0 else None
+        except (TimeoutError, OSError, ValueError, KeyError) as e:
+            dlg = wx.MessageDialog(None, f'{csv_path}保存失败: {e}', 'Error', wx.OK | wx.ICON_ERROR)
+            dlg.ShowModal()
+            return
+        self.set_rows(csv_path, merged)
+        if conflict_path is not None:
+            ticks = ', '.join(str(c[0]) for c in conflicts[:10]) + (' ...' if len(conflicts) > 10 else '')
+            message = f'{len(conflicts)}个时刻({ticks})被其他标注者修改过, 已保留本机的标注, 对方的版本保存在{conflict_path}'
+            print('注意：' + message)
+            dlg = wx.MessageDialog(None, message, 'Conflict', wx.OK | wx.ICON_WARNING)
+            dlg.ShowModal()
+
+    def set_rows(self, csv_path, rows):
+        # rows: tick -> RowValues as saved in csv_path, which becomes the base of the next merge
+        videoname = os.path.split(csv_path)[-1][:-4] + '.mp4'
+        self.load_path = csv_path
+        self.base = dict(rows)
+        self.data = {}
+        for tick, values in rows.items():
+            self.data[tick] = dict(zip(['type'] + ROW_FIELDS, values))
+            self.data[tick]['videoname'] = videoname
+        self.sorted_keys = sorted(self.data.keys())
         self._dirty = False
 
     def register(self, reg_dict:dict):
@@ -186,11 +203,7 @@ def create_file_folder():
                 os.makedirs(po, exist_ok=True)
                 os.makedirs(joined(po, 'annotated_imgs'), exist_ok=True)
                 os.makedirs(joined(po, 'origin_imgs'), exist_ok=True)
-    # clear cache dir
-    if isMacOS:
-        subprocess.call(['rm', '-rf', 'video_cache'])
-    else:
-        shutil.rmtree('video_cache', ignore_errors=True)
+    # cache dir is kept between sessions, see ArtefactCache
     os.makedirs('video_cache', exist_ok=True)
 
 class Selector(wx.MiniFrame):
@@ -217,6 +230,7 @@ class Selector(wx.MiniFrame):
             (5*60*1000.0, '5 minutes', 17, 25),
         ]
         self.current_tick_option = 3
+        self.frame_ms = self.tick_option[0][0]
 
         # painting
         self.paint_timer = wx.Timer(self)
@@ -227,12 +241,39 @@ class Selector(wx.MiniFrame):
         
         self.frame_width = 25
         self.frame_height = 60
+        self.strip_height = 20 # height of annotation strip under thumbnail
         self.margin = 5
         self.window_height = 120
         self.window_width = 15*(self.frame_width + self.margin)
         self.draw_y = self.panel.GetSize().GetHeight() // 2 + self.frame_height // 2
         self.locked = False
         self.center_idx = 0
+        self.thumb_bitmaps = {} # (atlas, level_ms, index, w, h) -> wx.Bitmap
+
+    def GetThumbBitmap(self, tick, t_interval, w, h):
+        atlas = self.Parent.thumb_atlas
+        loc = atlas.locate(tick, t_interval) if atlas is not None else None
+        if loc is None:
+            return None
+        key = (id(atlas), loc[0], loc[1], w, h)
+        if key not in self.thumb_bitmaps:
+            thumb = atlas.atlas[loc[0]][loc[1]]
+            if len(self.thumb_bitmaps) > 1024:
+                self.thumb_bitmaps.clear()
+            th, tw = thumb.shape[:2]
+            # crop center to the aspect ratio of tile
+            cw = min(tw, round(th * w / h))
+            ch = min(th, round(tw * h / w))
+            x0, y0 = (tw - cw) // 2, (th - ch) // 2
+            img = wx.Image(tw, th, np.ascontiguousarray(thumb).tobytes())
+            img = img.GetSubImage(wx.Rect(x0, y0, cw, ch)).Scale(w, h, quality=wx.IMAGE_QUALITY_NORMAL)
+            self.thumb_bitmaps[key] = wx.Bitmap(img)
+        return self.thumb_bitmaps[key]
+
+    def SetFrameInterval(self, frame_ms):
+        # the finest tick is one frame of current video
+        self.frame_ms = frame_ms
+        self.tick_option[0] = (frame_ms,) + self.tick_option[0][1:]
 
     def OnMouseWheel(self, evt):
         # reset initial mouse xy if scale is changed
@@ -271,6 +312,7 @@ class Selector(wx.MiniFrame):
         self.x_delta = 0
         self.Hide()
 
+    @profiled()
     def OnPaint(self, evt):
         size = self.panel.GetSize() # w,h
         tile_width = self.frame_width + self.margin
@@ -322,7 +364,8 @@ class Selector(wx.MiniFrame):
         
         for idx in range(start_idx, end_idx+1):
             draw_x = round(size[0] // 2 + (idx-1) * tile_width + (corrected_x + 0.5*tile_width) % tile_width)
-            if (draw_x - size[0] // 2) != 0 and  (draw_x - size[0] // 2) * (draw_x + tile_width - size[0] // 2) <= 0: # now selected rectangle
+            selected = (draw_x - size[0] // 2) != 0 and  (draw_x - size[0] // 2) * (draw_x + tile_width - size[0] // 2) <= 0
+            if selected: # now selected rectangle
                 dc.SetPen(wx.Pen(wx.Colour(233, 232, 88, 250), 2))
             else:
                 dc.SetPen(wx.TRANSPARENT_PEN)
@@ -331,6 +374,11 @@ class Selector(wx.MiniFrame):
             rec_x = draw_x + self.margin // 2
             rec_y = self.draw_y
             rec_height = self.frame_height
+            # thumbnail on the top of tile, annotation colors on the bottom strip
+            thumb = self.GetThumbBitmap((t_bounds[idx][0] + t_bounds[idx][1]) // 2, t_interval, self.frame_width, rec_height - self.strip_height)
+            if thumb is not None:
+                dc.DrawBitmap(thumb, rec_x, rec_y)
+                rec_y, rec_height = rec_y + self.frame_height - self.strip_height, self.strip_height
             # banner will not move if mouse is on annotated ticks
             if 'image' in query_result and 'comment_only' in query_result:
                 dc.SetBrush(wx.Brush(wx.Colour(64, 150, 243, alpha)))
@@ -349,6 +397,10 @@ class Selector(wx.MiniFrame):
                 else:
                     dc.SetBrush(wx.Brush(wx.Colour(0, 0, 0, alpha)))
                 dc.DrawRectangle(rec_x, rec_y, self.frame_width, rec_height)
+            if thumb is not None and selected: # outline the whole tile
+                dc.SetBrush(wx.TRANSPARENT_BRUSH)
+                dc.DrawRectangle(rec_x, self.draw_y, self.frame_width, self.frame_height)
+            rec_y, rec_height = self.draw_y, self.frame_height
 
             dc.SetFont(wx.Font(15, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL))
             dc.DrawText(str(disp_idx), rec_x+2, rec_y + rec_height - 20)
@@ -364,7 +416,10 @@ class Selector(wx.MiniFrame):
         
         # send event to parent
         delta_tick = self.tick_option[self.current_tick_option][0] / (self.frame_width + self.margin) * x_delta
-        return x_delta, round(-delta_tick + self.init_time)
+        new_tick = -delta_tick + self.init_time
+        if self.current_tick_option == 0: # align to frame start
+            new_tick = round(new_tick / self.frame_ms) * self.frame_ms
+        return x_delta, round(new_tick)
 
     def OnMotion(self, evt):
         mouse_x = evt.GetPosition().x
@@ -383,6 +438,90 @@ class Selector(wx.MiniFrame):
         self.Parent.OnSelectFlushTimer(None)
         self.Parent.OnVideoLeftClick(evt)
 
+class VideoList(wx.ListCtrl):
+    '''Virtual list of videos, rows are drawn from cached summaries on demand, so its cost does not grow with the project
+    '''
+    COLUMNS = [('Video', 260), ('Annotations', 90), ('Images', 70), ('Last Edit', 130), ('State', 70)]
+
+    def __init__(self, parent, main_window):
+        wx.ListCtrl.__init__(self, parent, -1, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL)
+        self.main_window = main_window
+        for i, (title, width) in enumerate(self.COLUMNS):
+            self.InsertColumn(i, title, width=width)
+        self.rows = [] # indices of visible videos in main_window.video_names
+
+    def SetRows(self, rows):
+        self.rows = rows
+        self.SetItemCount(len(rows))
+        self.Refresh()
+
+    def OnGetItemText(self, item, col):
+        idx = self.rows[item]
+        video_name = self.main_window.video_names[idx]
+        if col == 0:
+            return video_name
+        if col == 4:
+            if idx == self.main_window.video_idx:
+                return 'unsaved' if VIDEO_ANNO.is_dirty() else 'open'
+            return ''
+        summary = self.main_window.summaries.get(video_name)
+        if summary is None:
+            return '...'
+        if col == 1:
+            return str(summary['annotations'])
+        if col == 2:
+            return str(summary['images'])
+        return time.strftime('%Y-%m-%d %H:%M', time.localtime(summary['last_edit'])) if summary['last_edit'] else '-'
+
+
+class VideoListFrame(wx.Frame):
+    '''Searchable video list, double click or Enter opens a video
+    '''
+    def __init__(self, parent):
+        wx.Frame.__init__(self, parent, -1, title='Video List', size=(660, 480), style=wx.DEFAULT_FRAME_STYLE | wx.FRAME_FLOAT_ON_PARENT)
+        self.main_window = parent
+        panel = wx.Panel(self, -1)
+        self.search = wx.SearchCtrl(panel, -1)
+        self.search.ShowCancelButton(True)
+        self.list = VideoList(panel, parent)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(self.search, flag=wx.EXPAND | wx.ALL, border=5)
+        sizer.Add(self.list, 1, flag=wx.EXPAND)
+        panel.SetSizer(sizer)
+        self.search.Bind(wx.EVT_TEXT, self.OnSearch)
+        self.search.Bind(wx.EVT_SEARCHCTRL_CANCEL_BTN, lambda evt: self.search.SetValue(''))
+        self.list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.OnActivate)
+        self.Bind(wx.EVT_CLOSE, lambda evt: self.Hide())
+        # repaint when background summaries or the state of the open video change
+        self.shown_state = None
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnTimer, self.timer)
+        self.timer.Start(500)
+        self.video_names = []
+        self.lower_names = []
+
+    def SetVideos(self, video_names):
+        self.video_names = video_names
+        self.lower_names = [vn.lower() for vn in video_names]
+        self.OnSearch(None)
+
+    def OnSearch(self, evt):
+        keyword = self.search.GetValue().strip().lower()
+        self.list.SetRows([i for i, vn in enumerate(self.lower_names) if keyword in vn])
+
+    def OnActivate(self, evt):
+        self.main_window.ToggleVideo(self.list.rows[evt.GetIndex()])
+        self.list.Refresh()
+
+    def OnTimer(self, evt):
+        if not self.IsShown():
+            return
+        state = (self.main_window.summaries.version, self.main_window.video_idx, VIDEO_ANNO.is_dirty())
+        if state != self.shown_state:
+            self.shown_state = state
+            self.list.Refresh() # only visible rows are asked for their text
+
+
 class VideoAnnotator(wx.Frame):
     """The main window has to deal with events.
     """
@@ -396,8 +535,22 @@ class VideoAnnotator(wx.Frame):
 
         # search input folder
         create_file_folder()
+        self.cache = ArtefactCache('video_cache', self.conf['cache']['max_size_mb'])
+        self.mask_stores = {} # video name -> MaskStore of annotated_imgs
+        self.frame_stores = {} # video name -> FrameStore of origin_imgs
+        self.store_lock = threading.Lock() # stores are also opened by the background comment render
+        self.render_lock = threading.Lock() # C key waits for the background render of the same image
         self.video_idx = 0
         self.video_manu = None
+        self.summaries = SummaryPool() # per-video progress shown in the video list
+        self.video_list = None
+        self.manifests = ManifestPool(self.conf['probe_workers'])
+        self.proxies = None
+        self.proxy_key = None # cache key of the proxy of the current video, pinned
+        self.using_proxy = False
+        if self.conf['proxy']['enable']:
+            pc = self.conf['proxy']
+            self.proxies = ProxyBuilder(self.cache, pc['height'], pc['crf'], pc['workers'])
 
         # Menu Bar
         # File Menu
@@ -412,7 +565,6 @@ class VideoAnnotator(wx.Frame):
         self.file_menu.AppendSeparator()
         self.file_menu.Append(5, "&Save Annotations on Current Video")
         self.file_menu.Append(6, "&Export All Annotations")
-        self.video_id_offset = 10
         self.Bind(wx.EVT_MENU, self.OnFlushFolder, id=1)
         self.Bind(wx.EVT_MENU, lambda evt: self.Close(), id=2)
         self.Bind(wx.EVT_CLOSE, self.OnExit)
@@ -423,6 +575,8 @@ class VideoAnnotator(wx.Frame):
 
         self.frame_menubar.Append(self.file_menu, "File")
         self.video_manu = wx.Menu()
+        self.video_manu.Append(7, "&Search Videos...\tCtrl+L")
+        self.Bind(wx.EVT_MENU, self.OnShowVideoList, id=7)
         self.frame_menubar.Append(self.video_manu, "Video List")
         self.OnFlushFolder(None)
         self.SetMenuBar(self.frame_menubar)
@@ -451,6 +605,16 @@ class VideoAnnotator(wx.Frame):
         self.commentpanel.Bind(wx.EVT_PAINT, self.OnPaintCommentImg)
         self.commentpanel.Hide()
 
+        # fifth panel for previewing buffered frames in selecting
+        self.frame_buffer = None
+        self.thumb_atlas = None
+        self.thumb_atlases = {} # video path -> ThumbnailAtlas, generated atlases are kept during the session
+        self.preview_bitmap = None
+        self.previewpanel = wx.Panel(self, -1)
+        self.previewpanel.SetBackgroundColour(wx.BLACK)
+        self.previewpanel.Bind(wx.EVT_PAINT, self.OnPaintPreview)
+        self.previewpanel.Hide()
+
         self.pause = wx.Button(ctrlpanel, label="Pause")
         self.pause.Disable()
         self.play = wx.Button(ctrlpanel, label="Play")
@@ -474,6 +638,7 @@ class VideoAnnotator(wx.Frame):
         self.Bind(wx.EVT_SCROLL_THUMBTRACK, self.OnSeek, self.timeslider)
         self.Bind(wx.EVT_SCROLL_THUMBRELEASE, self.OnRelease, self.timeslider)
 
+        # all seeks go through seeker, seek_timer pumps it until the last seek landed
         self.seek_timer = wx.Timer(self)
         self.Bind(wx.EVT_TIMER, self.OnSeekTimer, self.seek_timer)
 
@@ -500,16 +665,17 @@ class VideoAnnotator(wx.Frame):
         sizer = wx.BoxSizer(wx.VERTICAL)
         sizer.Add(self.videopanel, 1, flag=wx.EXPAND)
         sizer.Add(self.commentpanel, 1, flag=wx.EXPAND)
+        sizer.Add(self.previewpanel, 1, flag=wx.EXPAND)
         sizer.Add(ctrlpanel, flag=wx.EXPAND | wx.BOTTOM | wx.TOP, border=10)
         self.SetSizer(sizer)
         self.SetMinSize((350, 300))
 
-        # finally create the timer, which updates the timeslider
-        self.slider_timer = wx.Timer(self)
-        self.Bind(wx.EVT_TIMER, self.OnSliderTimer, self.slider_timer)
-
         # image annotating flag
         self.img_annotating = False
+        self.annotator = AnnotatorProcess()
+        self.annotating_info = None
+        self.annotator_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnAnnotatorTimer, self.annotator_timer)
 
         if isMacOS:
             self.comment.SetEditable(False)
@@ -523,15 +689,34 @@ class VideoAnnotator(wx.Frame):
         else:
             self.Instance = vlc.Instance()
         self.player = self.Instance.media_player_new()
+        self.seeker = SeekScheduler(self.player, self.conf['seek']['tolerance_ms'], self.conf['seek']['timeout_ms'])
+        # finally subscribe player events, which update the timeslider
+        self.player_adapter = PlayerAdapter(self.player, wx.CallAfter,
+            on_time=self.OnPlayerTime, on_length=self.OnPlayerLength, on_end=self.OnPlayerEnd)
 
     def init_regex(self):
-        sample_tag_body = r"\b(?:" + '|'.join(self.conf['comment']['sample_keys']) + r")\b(?:,\b(?:" \
-            + '|'.join(self.conf['comment']['sample_keys']) + r")\b)*"
-        frame_tag_body = r"\b(?:" + '|'.join(self.conf['comment']['frame_keys']) + r")\b(?:,\b(?:" \
-            + '|'.join(self.conf['comment']['frame_keys']) + r")\b)*"
-        self.re_pattern = r"\d" + "@" + sample_tag_body + "|" + 'frm' + "@" + frame_tag_body
-        print('RE_PATTERN:', self.re_pattern)
+        self.grammar = CommentGrammar(self.conf['comment']['sample_keys'], self.conf['comment']['frame_keys'])
+        print('RE_PATTERN:', self.grammar.pattern)
         self.comment_info = None
+        self.comment_text = '' # text and spans after the last keystroke, only changed spans are restyled
+        self.comment_spans = []
+        self.comment_attrs = None # created with the comment panel
+
+    def GetCommentAttr(self, kind):
+        if self.comment_attrs is None:
+            field_attr = wx.TextAttr(wx.Colour(70, 184, 92), wx.WHITE, font=wx.Font(15, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD))
+            self.comment_attrs = {
+                SPAN_SAMPLE: field_attr,
+                SPAN_FRAME: field_attr,
+                SPAN_TEXT: wx.TextAttr(wx.Colour(113, 113, 113), wx.Colour(200, 200, 200), font=wx.Font(14, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD)),
+            }
+        return self.comment_attrs[kind]
+
+    def SetComment(self, text):
+        # SetValue replaces all styles, so every span is restyled by OnInputComment
+        self.comment_text = ''
+        self.comment_spans = []
+        self.comment.SetValue(text)
 
     def OnFlushFolder(self, evt):
         # collect videos
@@ -541,17 +726,28 @@ class VideoAnnotator(wx.Frame):
                 self.video_names.append(pv)
         self.video_idx = 0
         self.video_path = joined('video_input', self.video_names[self.video_idx]) if len(self.video_names) > 0 else None
-        # update manu, avoid id conflict
-        for i in range(self.video_manu.GetMenuItemCount()):
-            self.video_manu.DestroyItem(i+self.video_id_offset)
-        for idx, vn in enumerate(self.video_names):
-            self.video_manu.Append(idx+self.video_id_offset, '&' + vn)
-            self.Bind(wx.EVT_MENU, self.OnSelectVideo, id=idx+self.video_id_offset)
-
-    def OnSelectVideo(self, evt):
-        self.ToggleVideo(evt.GetId()-self.video_id_offset)
+        # probe all videos in background, manifests are reused until the video file changes
+        for vn in self.video_names:
+            self.manifests.submit(joined('video_input', vn), joined('video_output', vn, 'manifest.json'))
+        if self.proxies is not None:
+            for vn in self.video_names:
+                self.proxies.submit(joined('video_input', vn))
+        # summaries are only recomputed for videos changed since the last session
+        self.summaries.refresh(self.video_names)
+        if self.video_list is not None:
+            self.video_list.SetVideos(self.video_names)
+
+    def OnShowVideoList(self, evt):
+        if self.video_list is None:
+            self.video_list = VideoListFrame(self)
+            self.video_list.SetVideos(self.video_names)
+        self.summaries.refresh(self.video_names)
+        self.video_list.Show()
+        self.video_list.Raise()
 
     def ToggleVideo(self, new_idx):
+        if self.img_annotating:
+            return
         if new_idx < len(self.video_names) and new_idx >= 0 and new_idx != self.video_idx:
             toggle_flag = self.AskSavingAnnotation(joined('video_annotation', self.video_names[self.video_idx].replace('.mp4', '.csv')))
             if not toggle_flag: # Do nothing
@@ -602,26 +798,48 @@ class VideoAnnotator(wx.Frame):
             self.errorDialog(f'{combined_csv_path}被另一个程序打开, 无法保存')
             dlg.Update(len(file_list), 'Error')
             return
+        rows = []
+        for csv_name in file_list:
+            with open(joined('video_annotation', csv_name), 'r', encoding='utf-8') as fc:
+                rows.append(list(csv.DictReader(fc)))
+        # near-duplicate frames across all videos share a group, named by its first frame
+        groups = {}
+        if GBL_CONF['duplicate']['enable']:
+            entries = [(row['videoname'], row['img_name']) for file_rows in rows for row in file_rows if row['type'] == 'image']
+            conf = GBL_CONF['duplicate']
+            groups = dict(zip(entries, DuplicateGroups(entries, conf['max_distance'], conf['workers'])))
+        codec = GetCodec('export')
         with open(combined_csv_path, 'w', encoding='utf-8', newline='') as fp:
             writer = csv.writer(fp)
-            writer.writerow(['tick', 'type', 'videoname', 'img_name', 'region_count', 'sample_attr', 'frame_attr', 'comment', 'anchors'])
+            writer.writerow(['tick', 'type', 'videoname', 'img_name', 'region_count', 'sample_attr', 'frame_attr', 'comment', 'anchors', 'duplicate_group'])
             # copy all annotations and images
             for idx, csv_name in enumerate(file_list):
                 dlg.Update(idx, 'Exporting ' + csv_name)
-                csv_path = joined('video_annotation', csv_name)
-                with open(csv_path, 'r', encoding='utf-8') as fc:
-                    reader = csv.DictReader(fc)
-                    for row in reader:
-                        if row['type'] == 'image':
-                            img_path = joined('video_output', row['videoname'], 'origin_imgs', row['img_name'])
-                            saved_img_path = joined('video_output', row['videoname'], 'annotated_imgs', row['img_name'])
-                            if isMacOS:
-                                subprocess.call(['cp', img_path, joined(output_folder, 'origin_imgs', row['img_name'])])
-                                subprocess.call(['cp', saved_img_path, joined(output_folder, 'annotated_imgs', row['img_name'])])
-                            else:
-                                shutil.copy(img_path, joined(output_folder, 'origin_imgs', row['img_name']))
-                                shutil.copy(saved_img_path, joined(output_folder, 'annotated_imgs', row['img_name']))
-                        writer.writerow([v for k, v in row.items()])
+                for row in rows[idx]:
+                    group = groups.get((row['videoname'], row['img_name']))
+                    row['duplicate_group'] = f'{group[0]}/{group[1]}' if group is not None else ''
+                    if row['type'] == 'image':
+                        frame = self.GetFrameStore(row['videoname']).read_bytes(row['img_name'])
+                        if frame is None:
+                            print(f'注意：{row["videoname"]}中{row["img_name"]}的原图不存在')
+                            writer.writerow([v for k, v in row.items()])
+                            continue
+                        mask = self.GetMaskStore(row['videoname']).get(row['img_name'])
+                        # exported files carry the extension of the export codec
+                        row['img_name'] = os.path.splitext(row['img_name'])[0] + codec.ext
+                        same_format = SniffFormat(frame) == codec.format
+                        img = DecodeImage(frame) if mask is not None or not same_format else None
+                        if same_format: # copied as is, no re-encoding loss
+                            with open(joined(output_folder, 'origin_imgs', row['img_name']), 'wb') as fi:
+                                fi.write(frame)
+                        else:
+                            codec.write(joined(output_folder, 'origin_imgs', row['img_name']), img)
+                        # painted images are only produced for export
+                        if mask is not None:
+                            codec.write(joined(output_folder, 'annotated_imgs', row['img_name']), PaintMask(img, mask))
+                        else:
+                            print(f'注意：{row["videoname"]}中{row["img_name"]}没有标注')
+                    writer.writerow([v for k, v in row.items()])
         dlg.Update(len(file_list), 'Done')
 
     def GetSnapshoot(self, out_path):
@@ -633,32 +851,14 @@ class VideoAnnotator(wx.Frame):
     
     def OnPressKey(self, evt):
         # press c to comment
+        if self.img_annotating:
+            return
         code = evt.GetKeyCode()
         if code == ord('c') or code == ord('C'):
             # add comment though text
             if (not self.selecting) and (not self.player.is_playing()):
-                annotated_path = joined('video_output', self.video_names[self.video_idx], 'annotated_imgs', 
-                    str.split(self.video_names[self.video_idx], '.')[0] + '@' + str(self.player.get_time()) + '.jpg')
-                comment_out_path = joined('video_cache', str.split(self.video_names[self.video_idx], '.')[0] + '@' + str(self.player.get_time()) + '.jpg')
-                if exists(comment_out_path): # flush anchors
-                    os.remove(comment_out_path)
-                if exists(annotated_path): # comment only mode will not trigger image
-                    _, anchors = GetCommentImg(annotated_path, comment_out_path)
-                    self.comment_info = {'anchors': anchors}
-                if exists(comment_out_path):
-                    self.comment_img_path = comment_out_path
-                    self.videopanel.Hide()
-                    self.commentpanel.SetSize(self.videopanel.GetSize())
-                    self.commentpanel.Show()
-                else: # no image, comment only
-                    self.comment_img_path = None
-                if isMacOS:
-                    self.comment.SetEditable(True)
-                else:
-                    self.comment.Enable()
-                # set cursor to the end
-                self.comment.SetInsertionPointEnd()
-                self.comment.SetFocus()
+                self.UseProxy(False)
+                self.WhenLanded(self.OpenComment) # comment must be added at the landed tick
         elif code == ord('s') or code == ord('S'): 
             if (not self.selecting) and (self.player.get_media() is not None):
                 self.StartImageAnnotator()
@@ -668,37 +868,148 @@ class VideoAnnotator(wx.Frame):
             else:
                 self.OnPlay(None)
     
-    def OnPaintCommentImg(self, evt):
-        if not exists(self.comment_img_path):
+    def WhenLanded(self, callback):
+        # continue with callback once the player landed, wx keeps responsive while the original video reloads
+        if not self.seeker.when_landed(callback) and not self.seek_timer.IsRunning():
+            self.seek_timer.Start(10)
+
+    def OpenComment(self):
+        if self.img_annotating or self.selecting or self.player.is_playing() or not self.player.get_media():
             return
-        dc = wx.PaintDC(self.commentpanel)
-        # dc.SetBrush(wx.Brush(wx.Colour(0, 0, 255, 128)))
-        # dc.DrawRectangle(0, 0, self.commentpanel.GetSize().GetWidth(), self.commentpanel.GetSize().GetHeight())
-        # calculate real video size
-        ori_size = self.player.video_get_size()
-        wh_ratio = ori_size[0] / ori_size[1]
+        img_name = str.split(self.video_names[self.video_idx], '.')[0] + '@' + str(self.player.get_time()) + '.jpg'
+        if self.GetMaskStore(self.video_names[self.video_idx]).has(img_name): # comment only mode will not trigger image
+            comment_out_path, _, anchors = self.GetCommentRender(self.video_names[self.video_idx], img_name)
+            self.comment_info = {'anchors': anchors}
+            self.comment_img_path = comment_out_path
+            self.videopanel.Hide()
+            self.commentpanel.SetSize(self.videopanel.GetSize())
+            self.commentpanel.Show()
+        else: # no image, comment only
+            self.comment_img_path = None
+        if isMacOS:
+            self.comment.SetEditable(True)
+        else:
+            self.comment.Enable()
+        # set cursor to the end
+        self.comment.SetInsertionPointEnd()
+        self.comment.SetFocus()
+
+    def GetManifest(self):
+        # fps, duration and resolution of current video, None if it is not probed yet
+        if self.video_path is None:
+            return None
+        return self.manifests.get(self.video_path)
+
+    def GetVideoRect(self):
+        # calculate real video size in videopanel, return (w_offset, h_offset, w, h)
+        manifest = self.GetManifest()
+        if manifest is not None:
+            ori_size = (manifest['width'], manifest['height'])
+        else:
+            ori_size = self.player.video_get_size()
         vs = self.videopanel.GetSize()
+        if not ori_size or ori_size[0] <= 0 or ori_size[1] <= 0:
+            return 0, 0, vs[0], vs[1]
+        wh_ratio = ori_size[0] / ori_size[1]
         if vs[0] / vs[1] < wh_ratio:
             w, h = vs[0], round(vs[0] / wh_ratio)
             w_offset, h_offset = 0, (vs[1] - h) // 2
         else:
             w, h = round(vs[1]*wh_ratio), vs[1]
             w_offset, h_offset = (vs[0] - w) // 2, 0
+        return w_offset, h_offset, w, h
+
+    def GetMaskStore(self, video_name):
+        with self.store_lock:
+            if video_name not in self.mask_stores:
+                self.mask_stores[video_name] = MaskStore(joined('video_output', video_name, 'annotated_imgs'))
+            return self.mask_stores[video_name]
+
+    def GetFrameStore(self, video_name):
+        with self.store_lock:
+            if video_name not in self.frame_stores:
+                self.frame_stores[video_name] = FrameStore(joined('video_output', video_name, 'origin_imgs'), str.split(video_name, '.')[0])
+            return self.frame_stores[video_name]
+
+    def GetCommentRender(self, video_name, img_name, mask=None, stats=None):
+        # comment image and region stats are cached by the original image and mask content, return (path, n_region, anchors)
+        frames = self.GetFrameStore(video_name)
+        frame_id = frames.digest(img_name)
+        if frame_id is None: # frame file of the old layout
+            frame_id = self.cache.source_id(joined('video_output', video_name, 'origin_imgs', img_name))
+        digest = self.GetMaskStore(video_name).digest(img_name)
+        codec = GetCodec('renders', RENDER_FORMATS)
+        render_key = self.cache.content_key(frame_id, 'comment', f'{digest}:{codec}')
+        stats_key = self.cache.content_key(frame_id, 'region_stats', digest)
+        # renders use random colors, a second caller must reuse the render in progress instead of writing the same file
+        with self.render_lock:
+            if stats is not None:
+                self.cache.put_json('region_stats', stats_key, stats)
+            render_path = self.cache.get('comment', render_key)
+            stats = self.cache.get_json('region_stats', stats_key)
+            if render_path is None or stats is None:
+                if mask is None:
+                    mask = self.GetMaskStore(video_name).get(img_name)
+                render_path = self.cache.path('comment', render_key, codec.ext)
+                tmp_path = render_path + '.tmp'
+                n_region, anchors = GetCommentImg(frames.read(img_name), tmp_path, mask, codec)
+                os.replace(tmp_path, render_path) # committed size is the size of the complete file
+                self.cache.commit('comment', render_key, render_path)
+                stats = {'region_count': n_region, 'anchors': anchors}
+                self.cache.put_json('region_stats', stats_key, stats)
+        return render_path, stats['region_count'], [tuple(a) for a in stats['anchors']]
+
+    def OnPaintCommentImg(self, evt):
+        if not exists(self.comment_img_path):
+            return
+        dc = wx.PaintDC(self.commentpanel)
+        # dc.SetBrush(wx.Brush(wx.Colour(0, 0, 255, 128)))
+        # dc.DrawRectangle(0, 0, self.commentpanel.GetSize().GetWidth(), self.commentpanel.GetSize().GetHeight())
+        w_offset, h_offset, w, h = self.GetVideoRect()
         wximg = wx.Image(self.comment_img_path, wx.BITMAP_TYPE_ANY)
         wximg = wximg.Scale(w, h, quality=wx.IMAGE_QUALITY_HIGH)
         wximg = wx.Bitmap(wximg)
         dc.DrawBitmap(wximg, w_offset, h_offset)
+
+    def OnPaintPreview(self, evt):
+        dc = wx.PaintDC(self.previewpanel)
+        if self.preview_bitmap is not None:
+            w_offset, h_offset, _, _ = self.GetVideoRect()
+            dc.DrawBitmap(self.preview_bitmap, w_offset, h_offset)
+
+    def ShowPreview(self, frame):
+        # frame is a RGB array with display size
+        h, w = frame.shape[:2]
+        self.preview_bitmap = wx.Bitmap.FromBuffer(w, h, frame)
+        if not self.previewpanel.IsShown():
+            self.videopanel.Hide()
+            self.previewpanel.SetSize(self.videopanel.GetSize())
+            self.previewpanel.Show()
+        self.previewpanel.Refresh()
+
+    def HidePreview(self):
+        if self.previewpanel.IsShown():
+            self.previewpanel.Hide()
+            self.videopanel.Show()
+        self.preview_bitmap = None
     
     def StartImageAnnotator(self):
         # take a snapshoot and boot image annotator
+        self.UseProxy(False) # snapshot must be taken from the original video
+        self.WhenLanded(self.BootImageAnnotator) # snapshot must be taken at the landed tick
+
+    def BootImageAnnotator(self):
+        if self.img_annotating or self.selecting or not self.player.get_media(): # pressed twice or stopped meanwhile
+            return
         img_dir = joined('video_output', self.video_names[self.video_idx], 'origin_imgs')
         save_folder = joined('video_output', self.video_names[self.video_idx], 'annotated_imgs')
         img_name = str.split(self.video_names[self.video_idx], '.')[0] + '@' + str(self.player.get_time()) + '.jpg'
-        out_path = joined('video_cache', str.split(self.video_names[self.video_idx], '.')[0] + '@' + str(self.player.get_time()) + '.jpg')
-        comment_img_path = joined('video_output', self.video_names[self.video_idx], 'annotated_imgs',
-            str.split(self.video_names[self.video_idx], '.')[0] + '@' + str(self.player.get_time()) + '.jpg')
-        self.player.video_take_snapshot(0, joined(img_dir, img_name), 0, 0)
-        if exists(joined(img_dir, img_name)):
+        frames = self.GetFrameStore(self.video_names[self.video_idx])
+        if not (self.conf['frame_store']['enable'] and frames.has(img_name)):
+            self.player.video_take_snapshot(0, joined(img_dir, img_name), 0, 0)
+            if self.conf['frame_store']['enable'] and exists(joined(img_dir, img_name)):
+                frames.import_file(joined(img_dir, img_name), GetCodec('frames'))
+        if frames.has(img_name):
             self.img_annotating = True
             # disable components to prevent time changing
             self.timeslider.Disable()
@@ -710,41 +1021,64 @@ class VideoAnnotator(wx.Frame):
             if stop_status:
                 self.stop.Disable()
             
-            ImageAnnotator(addi_params={
+            self.annotating_info = {
+                'tick': self.player.get_time(),
+                'img_name': img_name,
+                'video_name': self.video_names[self.video_idx],
+                'status': (play_status, pause_status, stop_status),
+            }
+            # the annotator runs in another process, wx keeps responsive until the result comes back
+            self.annotator.start_session({
                 'img_dir': img_dir,
                 'save_folder': save_folder,
                 'init_img_name': img_name,
                 'single_img_mode': True
             })
-            # create img for comment
-            if exists(comment_img_path):
-                n_region, anchors = GetCommentImg(comment_img_path, out_path)
-                # register annotation
-                reg_dict = {
-                    'tick': self.player.get_time(),
-                    'type': 'image',
-                    'video_name': self.video_names[self.video_idx],
-                    'img_name': img_name,
-                    'region_count':n_region,
-                    'anchors': anchors
-                }
-                VIDEO_ANNO.register(reg_dict)
-
-            if play_status:
-                self.play.Enable()
-            if pause_status:
-                self.pause.Enable()
-            if stop_status:
-                self.stop.Enable()
-            self.img_annotating = False
-            self.timeslider.Enable()
-            
-            self.Raise() # fetch focus
-            if isWin:
-                self.videopanel.SetFocus()
+            self.annotator_timer.Start(50)
         else:
             print('截图失败')
 
+    def OnAnnotatorTimer(self, evt):
+        result = self.annotator.poll()
+        if result is None:
+            return
+        self.annotator_timer.Stop()
+        info = self.annotating_info
+        # create img for comment
+        if result['saved']:
+            stats = {'region_count': result['region_count'], 'anchors': result['anchors']}
+            # render comment image from the returned mask in background, C key opens it instantly
+            threading.Thread(target=self.GetCommentRender, args=(info['video_name'], info['img_name'], result['mask'], stats), daemon=True).start()
+            n_region, anchors = result['region_count'], result['anchors']
+        elif self.GetMaskStore(info['video_name']).has(info['img_name']):
+            _, n_region, anchors = self.GetCommentRender(info['video_name'], info['img_name'])
+        if result['saved'] or self.GetMaskStore(info['video_name']).has(info['img_name']):
+            # register annotation
+            reg_dict = {
+                'tick': info['tick'],
+                'type': 'image',
+                'video_name': self.video_names[self.video_idx],
+                'img_name': info['img_name'],
+                'region_count':n_region,
+                'anchors': anchors
+            }
+            VIDEO_ANNO.register(reg_dict)
+            self.summaries.refresh([info['video_name']])
+
+        play_status, pause_status, stop_status = info['status']
+        if play_status:
+            self.play.Enable()
+        if pause_status:
+            self.pause.Enable()
+        if stop_status:
+            self.stop.Enable()
+        self.img_annotating = False
+        self.timeslider.Enable()
+        
+        self.Raise() # fetch focus
+        if isWin:
+            self.videopanel.SetFocus()
+
     def OnFinishComment(self, evt):
         self.OnInputComment(evt) # NOTE: It is necessary when user do not edit anything before closing. Forcing update comment info at least once.
         # register annotation
@@ -779,27 +1113,18 @@ class VideoAnnotator(wx.Frame):
         self.comment_info = None
         self.videopanel.SetFocus()
     
+    @profiled()
     def OnInputComment(self, evt):
-        # run regex
+        # tokenize, then restyle spans changed since the last keystroke
         input_str = evt.GetString()
-        result = re.findall(self.re_pattern, input_str)
-        spt = re.split('(' + self.re_pattern + ')', input_str)
-        spt = [s for s in spt if s != '']
-        for idx in range(len(spt)):
-            i_start = 0 if idx == 0 else len(''.join(spt[0:idx]))
-            if spt[idx] in result:
-                self.comment.SetStyle(i_start, i_start + len(spt[idx]), \
-                    wx.TextAttr(wx.Colour(70, 184, 92), wx.WHITE, font=wx.Font(15, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD)))
-            else:
-                self.comment.SetStyle(i_start, i_start + len(spt[idx]), \
-                    wx.TextAttr(wx.Colour(113, 113, 113), wx.Colour(200, 200, 200), font=wx.Font(14, wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD)))
+        spans = self.grammar.tokenize(input_str)
+        cursor = self.comment.GetInsertionPoint()
+        for start, end, kind in changed_spans(self.comment_text, self.comment_spans, input_str, spans, cursor):
+            self.comment.SetStyle(start, end, self.GetCommentAttr(kind))
+        self.comment_text = input_str
+        self.comment_spans = spans
         # update comment
-        unmatched = ' '.join([s for s in spt if (s not in result) and (s.strip() != '')])
-        comment_info = {
-            'comment': str.strip(input_str), # original comment
-            'fields': result,
-            'unmatched':  str.strip(unmatched),
-        }
+        comment_info = self.grammar.parse(input_str, spans)
         if self.comment_info and 'anchors' in self.comment_info:
             comment_info['anchors'] = self.comment_info['anchors']
         self.comment_info = comment_info
@@ -811,6 +1136,7 @@ class VideoAnnotator(wx.Frame):
             result = dlg.ShowModal()
             if result == wx.ID_YES:
                 VIDEO_ANNO.save_data(csv_path)
+                self.summaries.refresh([os.path.split(csv_path)[-1][:-4] + '.mp4'])
                 return True
             elif result == wx.ID_CANCEL:
                 return False
@@ -833,6 +1159,20 @@ class VideoAnnotator(wx.Frame):
             if exit_flag:
                 self.Destroy()
 
+    def Destroy(self):
+        if self.frame_buffer is not None:
+            self.frame_buffer.close()
+            self.frame_buffer = None
+        shutdown_pool()
+        self.annotator.close()
+        self.manifests.shutdown()
+        self.summaries.shutdown()
+        if self.proxies is not None:
+            self.proxies.shutdown()
+        self.cache.save()
+        print(self.seeker.summary())
+        return super().Destroy()
+
     def LoadVideoAndAnnotation(self):
         if self.video_idx < 0 or self.video_idx >= len(self.video_names):
             return
@@ -845,6 +1185,30 @@ class VideoAnnotator(wx.Frame):
         # load video
         self.Media = self.Instance.media_new(self.video_path)
         self.player.set_media(self.Media)
+        self.using_proxy = False
+        if self.proxies is not None: # the proxy of the current video may be played at any time
+            if self.proxy_key is not None:
+                self.cache.unpin(self.proxy_key)
+            self.proxy_key = self.proxies.key(self.video_path)
+            self.cache.pin(self.proxy_key)
+        if self.frame_buffer is not None:
+            self.frame_buffer.close()
+            self.frame_buffer = None
+        if self.conf['frame_buffer']['enable']:
+            _, _, w, h = self.GetVideoRect()
+            self.frame_buffer = FrameRingBuffer(self.video_path, (w, h), self.conf['frame_buffer']['budget_mb'])
+        self.thumb_atlas = None
+        if self.conf['thumbnail']['enable']:
+            if self.video_path not in self.thumb_atlases:
+                tc = self.conf['thumbnail']
+                key = self.cache.key(self.video_path, 'thumbs', '%dx%d' % (tc['width'], tc['height']))
+                entry_dir = self.cache.path('thumbs', key)
+                self.cache.get('thumbs', key) # mark as recently used
+                self.cache.pin(key) # atlases stay memory mapped during the session
+                self.thumb_atlases[self.video_path] = ThumbnailAtlas(self.video_path, entry_dir,
+                    (tc['width'], tc['height']), tc['workers'], tc['chunk_seconds'],
+                    on_complete=lambda: self.cache.commit('thumbs', key, entry_dir))
+            self.thumb_atlas = self.thumb_atlases[self.video_path]
         if isWin:
             #self.player.get_media().get_mrl().replace("input_clock=system", "input_clock=none") # disable clock sync
             self.player.set_fullscreen(False)
@@ -855,6 +1219,9 @@ class VideoAnnotator(wx.Frame):
         # if an error was encountred while retrieving the title,
         # otherwise use filename
         self.SetTitle("%s - %s" % (title if title != -1 else 'Annotator', basename(self.video_path)))
+        manifest = self.GetManifest()
+        if manifest is not None and manifest['duration_ms'] > 0:
+            self.timeslider.SetRange(-1, manifest['duration_ms'])
         # set the window id where to render VLC's video output
         handle = self.videopanel.GetHandle()
         if sys.platform.startswith('linux'):  # for Linux using the X Server
@@ -882,41 +1249,56 @@ class VideoAnnotator(wx.Frame):
             if flag:
                 self.errorDialog("Can not play")
             else:
-                self.slider_timer.Start(100)  # XXX millisecs
                 self.play.Disable()
                 self.pause.Enable()
                 self.stop.Enable()
                 if isWin:
                     self.videopanel.SetFocus()
                 # clear comment
-                self.comment.SetValue('')
+                self.SetComment('')
 
     def UpdateComment(self):
         # update comment, SetValue will trigger OnInputComment
-        query_result = VIDEO_ANNO.query_tick(self.player.get_time())
+        query_result = VIDEO_ANNO.query_tick(self.seeker.target())
         if query_result is not None:
             if 'comment' in query_result:
-                self.comment.SetValue(query_result['comment'])
+                self.SetComment(query_result['comment'])
             else:
-                self.comment.SetValue('')
+                self.SetComment('')
         else:
-            self.comment.SetValue('')
+            self.SetComment('')
 
     def OnVideoLeftClick(self, evt):
+        if self.img_annotating:
+            return
         if self.selecting:
             self.selecting = False
             self.select_flush_timer.Stop() # this line cause a bug
             self.selectframe.OnHide()
+            # previewed frames are not shown by player, move player to the selected tick
+            if self.mouse_tick < self.timeslider.GetMax():
+                self.RequestSeek(self.mouse_tick)
+            self.UseProxy(False)
+            self.HidePreview()
             self.UpdateComment()
             self.videopanel.SetFocus()
         else:
             self.selecting = True
             if self.player.is_playing():
                 self.OnPause(None)
-            self.select_flush_timer.Start(200)
+            self.select_flush_timer.Start(40)
             self.mouse_tick = self.player.get_time() # initial mouse tick
+            manifest = self.GetManifest()
+            if manifest is not None and manifest['fps'] > 0:
+                self.selectframe.SetFrameInterval(1000.0 / manifest['fps'])
+            if self.frame_buffer is not None:
+                _, _, w, h = self.GetVideoRect()
+                if self.frame_buffer.display_size != (w, h):
+                    self.frame_buffer.set_display_size((w, h))
+                self.frame_buffer.request(self.mouse_tick)
             self.selectframe.OnShow(evt.GetPosition(), self.player.get_time())
 
+    @profiled()
     def OnVideoMotion(self, new_tick):
         if (not self.selecting) or (not self.player.get_media()):
             return
@@ -924,11 +1306,24 @@ class VideoAnnotator(wx.Frame):
         self.mouse_tick = max(0, min(self.timeslider.GetMax(), new_tick))
     
     def OnSelectFlushTimer(self, evt):
-        # NOTE New request coming up will block decoder
-        if self.mouse_tick < self.timeslider.GetMax() and self.mouse_tick != self.player.get_time():
-            self.player.set_time(self.mouse_tick)
-            self.timeslider.SetValue(self.mouse_tick)
-            self.SetTimeLabel(self.mouse_tick)
+        if self.mouse_tick >= self.timeslider.GetMax():
+            return
+        frame = None
+        if self.frame_buffer is not None:
+            self.frame_buffer.request(self.mouse_tick)
+            frame = self.frame_buffer.get(self.mouse_tick)
+        if frame is None and self.thumb_atlas is not None: # navigate with thumbnails without decoding
+            thumb = self.thumb_atlas.get(self.mouse_tick)
+            if thumb is not None:
+                _, _, w, h = self.GetVideoRect()
+                frame = cv2.resize(thumb, (w, h), interpolation=cv2.INTER_LINEAR)
+        if frame is not None: # buffered, no seeking is needed
+            self.ShowPreview(frame)
+        elif self.mouse_tick != self.seeker.target():
+            self.HidePreview()
+            self.RequestSeek(self.mouse_tick)
+        self.timeslider.SetValue(self.mouse_tick)
+        self.SetTimeLabel(self.mouse_tick)
 
     def SetTimeLabel(self, tick):
         self.time_label.SetLabel(f'[{tick}] ' + self.GetTimeString(tick) + '/' + self.GetTimeString(self.timeslider.GetMax()))
@@ -962,53 +1357,92 @@ class VideoAnnotator(wx.Frame):
         if not flag:
             return
         self.seeking = False
+        self.seeker.reset()
+        self.seek_timer.Stop()
+        if self.using_proxy: # restore original video
+            self.player.set_media(self.Media)
+            self.using_proxy = False
         self.player.stop()
         # reset the time slider
         self.timeslider.SetValue(0)
         self.time_label.SetLabel('00:00:00')
-        self.comment.SetValue('')
-        self.slider_timer.Stop()
+        self.SetComment('')
         self.play.Enable()
         self.pause.Disable()
         self.stop.Disable()
         if isWin:
             self.videopanel.SetFocus()
 
-    def OnSliderTimer(self, evt):
-        """Update the time slider according to the current movie time.
+    def OnPlayerTime(self, time):
+        """Update the time slider when the movie time changed.
         """
-        if self.seeking or self.selecting:
-            return
-        if self.player.get_state() == vlc.State.Ended:
-            self.slider_timer.Stop()
-            self.OnStop(None)
+        if self.seeker.busy() and self.seeker.pump():
+            self.seek_timer.Stop()
+        if self.seeking or self.selecting or self.seeker.busy() or not self.player.get_media():
             return
-        # since the self.player.get_length can change while playing,
-        # re-set the timeslider to the correct range.
-        length = self.player.get_length()
-        self.timeslider.SetRange(-1, length)
-        # update the time on the slider
-        time = self.player.get_time()
-        self.timeslider.SetValue(time)
+        if self.timeslider.GetValue() != time:
+            self.timeslider.SetValue(time)
         self.SetTimeLabel(time)
 
+    def OnPlayerLength(self, length):
+        # the length reported by player is only used if the video is not probed
+        manifest = self.GetManifest()
+        if manifest is not None and manifest['duration_ms'] > 0:
+            length = manifest['duration_ms']
+        if length > 0 and self.timeslider.GetMax() != length:
+            self.timeslider.SetRange(-1, length)
+
+    def OnPlayerEnd(self):
+        if self.using_proxy: # end of proxy is not the end of video
+            return
+        self.OnStop(None)
+
     def OnSeek(self, evt):
         """Seek the player according to the time slider.
         """
         if not self.seeking:
             self.OnPause(None)
             self.seeking = True
-            self.seek_timer.Start(100)  # XXX millisecs
-
-    def OnSeekTimer(self, evt):
         offset = self.timeslider.GetValue()
         # Don't seek when the slider is at the end
         if offset < self.timeslider.GetMax():
-            self.player.set_time(offset)
+            self.RequestSeek(offset)
+
+    def UseProxy(self, flag):
+        # switch player between proxy and original video, keep current tick and pause state
+        if flag == self.using_proxy:
+            return
+        proxy_path = self.proxies.get(self.video_path) if (flag and self.proxies is not None) else None
+        if flag and proxy_path is None:
+            return
+        tick = self.seeker.target()
+        media = self.Instance.media_new(proxy_path if flag else self.video_path, 'start-paused', 'start-time=%.3f' % (tick / 1000))
+        self.player.set_media(media)
+        self.player.play()
+        self.using_proxy = flag
+        self.seeker.reset()
+        self.seeker.expect(tick)
+        if not self.seek_timer.IsRunning():
+            self.seek_timer.Start(10)
+
+    @profiled()
+    def RequestSeek(self, tick):
+        # superseded requests are dropped by seeker, scrubbing is done on proxy video if possible
+        if self.seeking or self.selecting:
+            self.UseProxy(True)
+        if tick != self.seeker.target():
+            self.seeker.request(tick)
+        if self.seeker.busy() and not self.seek_timer.IsRunning():
+            self.seek_timer.Start(10)
+
+    @profiled()
+    def OnSeekTimer(self, evt):
+        if self.seeker.pump():
+            self.seek_timer.Stop()
     
     def OnRelease(self, evt):
         self.seeking = False
-        self.seek_timer.Stop()
+        self.UseProxy(False)
         self.UpdateComment()
         if not self.conf['pause_after_seek']:
             self.OnPlay(None)
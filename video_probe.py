@@ -0,0 +1,138 @@
+import os
+import json
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+MANIFEST_VERSION = 1
+
+
+def _parse_rate(rate):
+    # '30000/1001' -> 29.97
+    try:
+        num, den = rate.split('/')
+        return float(num) / float(den) if float(den) != 0 else 0.0
+    except (ValueError, AttributeError):
+        return 0.0
+
+
+def _probe_ffprobe(video_path, ffprobe):
+    out = subprocess.run([ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+        'stream=avg_frame_rate,r_frame_rate,nb_frames,width,height,duration:format=duration', '-of', 'json', video_path],
+        capture_output=True, text=True, check=True).stdout
+    info = json.loads(out)
+    stream = info['streams'][0]
+    fps = _parse_rate(stream.get('avg_frame_rate')) or _parse_rate(stream.get('r_frame_rate'))
+    duration = float(stream.get('duration') or info.get('format', {}).get('duration') or 0)
+    # packet flags are read without decoding, 'K' marks keyframes
+    out = subprocess.run([ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0', video_path], capture_output=True, text=True, check=True).stdout
+    keyframes = []
+    for line in out.splitlines():
+        spt = line.split(',')
+        if len(spt) >= 2 and 'K' in spt[1] and spt[0] not in ['', 'N/A']:
+            keyframes.append(round(float(spt[0]) * 1000))
+    return {
+        'fps': fps,
+        'frame_count': int(stream['nb_frames']) if str(stream.get('nb_frames', '')).isdigit() else round(duration * fps),
+        'duration_ms': round(duration * 1000),
+        'width': int(stream['width']),
+        'height': int(stream['height']),
+        'keyframes': sorted(keyframes),
+    }
+
+
+def _probe_cv2(video_path):
+    # fallback without ffprobe, keyframes are unknown
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    result = {
+        'fps': fps,
+        'frame_count': frame_count,
+        'duration_ms': round(1000.0 * frame_count / fps) if fps > 0 else 0,
+        'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        'keyframes': [],
+    }
+    cap.release()
+    return result
+
+
+def load_manifest(video_path, manifest_path):
+    '''Return the probe manifest of video, probe again only if the video file changed (mtime or size)
+    '''
+    stat = os.stat(video_path)
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as fp:
+                manifest = json.load(fp)
+            if manifest.get('version') == MANIFEST_VERSION and manifest.get('video_size') == stat.st_size \
+                and manifest.get('video_mtime') == stat.st_mtime:
+                return manifest
+        except (OSError, ValueError):
+            pass
+    ffprobe = shutil.which('ffprobe')
+    manifest = None
+    if ffprobe is not None:
+        try:
+            manifest = _probe_ffprobe(video_path, ffprobe)
+        except (subprocess.CalledProcessError, KeyError, IndexError, ValueError) as e:
+            print(f'注意：ffprobe无法读取{video_path}: {e}')
+    if manifest is None:
+        manifest = _probe_cv2(video_path)
+    manifest.update({'version': MANIFEST_VERSION, 'video_size': stat.st_size, 'video_mtime': stat.st_mtime})
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as fp:
+        json.dump(manifest, fp)
+    return manifest
+
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        return None
+
+
+class ManifestPool():
+    '''Probe manifests of all videos in parallel, query without blocking
+
+    A failed probe is reported once and gives None until the video file changes (size or mtime), then it is probed
+    again.
+    '''
+    def __init__(self, workers=4) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=workers) # ffprobe runs in subprocess, threads are enough
+        self.futures = {} # video path -> (future, manifest path, file stamp when submitted)
+        self.failed = set()
+
+    def submit(self, video_path, manifest_path):
+        entry = self.futures.get(video_path)
+        stamp = _file_stamp(video_path)
+        if entry is None or entry[2] != stamp:
+            self.failed.discard(video_path)
+            self.futures[video_path] = (self.executor.submit(load_manifest, video_path, manifest_path), manifest_path, stamp)
+
+    def get(self, video_path, wait=False):
+        # return None if video is not probed yet or can not be probed
+        entry = self.futures.get(video_path)
+        if entry is None:
+            return None
+        future, manifest_path, stamp = entry
+        if video_path in self.failed:
+            if _file_stamp(video_path) != stamp: # replaced file, try again
+                self.submit(video_path, manifest_path)
+            return None
+        if not wait and not future.done():
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            self.failed.add(video_path)
+            print(f'注意：无法读取{video_path}的视频信息: {e}')
+            return None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,108 @@
+import os
+import csv
+import json
+import threading
+from os.path import join as joined
+from concurrent.futures import ThreadPoolExecutor
+from mask_store import MaskStore, INDEX_NAME as MASK_INDEX_NAME
+
+SUMMARY_PATH = joined('video_output', 'summary.json')
+SUMMARY_VERSION = 1
+
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return None
+
+
+def SummaryStamp(video_name):
+    # changes whenever the csv or the saved masks of video change, legacy JPEGs change the folder mtime
+    annotated = joined('video_output', video_name, 'annotated_imgs')
+    return [_stamp(joined('video_annotation', video_name.replace('.mp4', '.csv'))),
+        _stamp(joined(annotated, MASK_INDEX_NAME)), _stamp(annotated)]
+
+
+def summarize_video(video_name):
+    '''Progress of one video: number of annotations in csv, number of annotated images and time of the last edit
+    '''
+    csv_path = joined('video_annotation', video_name.replace('.mp4', '.csv'))
+    annotations = 0
+    if os.path.exists(csv_path):
+        try:
+            with open(csv_path, 'r', encoding='utf-8') as f:
+                annotations = sum(1 for _ in csv.DictReader(f))
+        except (OSError, UnicodeDecodeError, csv.Error):
+            pass
+    stamp = SummaryStamp(video_name)
+    mtimes = [s[1] for s in stamp[:2] if s is not None]
+    return {
+        'stamp': stamp,
+        'annotations': annotations,
+        'images': len(MaskStore(joined('video_output', video_name, 'annotated_imgs')).names()),
+        'last_edit': max(mtimes) / 1e9 if len(mtimes) > 0 else None,
+    }
+
+
+class SummaryPool():
+    '''Per-video summaries kept in video_output/summary.json and refreshed in background.
+
+    get() never touches the disk, a refresh only recomputes videos whose csv or masks changed since the last one.
+    version is increased whenever a summary changes, so views know when to repaint.
+    '''
+    def __init__(self, path=SUMMARY_PATH, workers=2) -> None:
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.summaries = {} # video name -> summary
+        self.version = 0
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as fp:
+                    data = json.load(fp)
+                if data.get('version') == SUMMARY_VERSION:
+                    self.summaries = data['videos']
+            except (OSError, ValueError, KeyError):
+                print(f'注意：{path}无法读取, 将重新统计')
+
+    def get(self, video_name):
+        # None if video was never summarized
+        with self.lock:
+            return self.summaries.get(video_name)
+
+    def refresh(self, video_names):
+        self.executor.submit(self._refresh, list(video_names))
+
+    def _refresh(self, video_names):
+        changed = False
+        for video_name in video_names:
+            summary = self.get(video_name)
+            if summary is not None and summary['stamp'] == SummaryStamp(video_name):
+                continue
+            try:
+                summary = summarize_video(video_name)
+            except OSError as e:
+                print(f'注意：无法统计{video_name}: {e}')
+                continue
+            with self.lock:
+                self.summaries[video_name] = summary
+                self.version += 1
+            changed = True
+        if changed:
+            self.save()
+
+    def save(self):
+        with self.lock:
+            data = {'version': SUMMARY_VERSION, 'videos': dict(self.summaries)}
+        try:
+            tmp_path = f'{self.path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as fp:
+                json.dump(data, fp)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass # summaries are recomputed next time
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)